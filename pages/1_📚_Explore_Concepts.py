@@ -1,6 +1,6 @@
 import streamlit as st
 from src.frontend.components.sidebar import show_api_keys, show_model_choice, show_email_fetching, show_concept_settings, show_mbox_upload
-from src.frontend.components.concepts import filter_concepts, show_concept_details
+from src.frontend.components.concepts import filter_concepts, show_concept_details, load_unused_concepts, load_more_unused_concepts
 from src.frontend.api_client import EchoAPIClient
 
 def main():
@@ -35,7 +35,7 @@ def main():
     with col4:
         days_before = st.number_input("Days before", value=30, min_value=0, max_value=365, step=1, help="Number of days before today to consider for concepts")
 
-    unused_concepts = api_client.get_unused_concepts(days_before=days_before)
+    unused_concepts = load_unused_concepts(api_client, days_before)
     if st.session_state.keyword_filter:
         unused_concepts, keywords_list = filter_concepts(
             keyword_filter=st.session_state.keyword_filter, 
@@ -80,6 +80,11 @@ def main():
                         if st.button("View Details 👀", key=f"view_{idx}", use_container_width=True):
                             show_concept_details(concept)
 
+    if st.session_state.get('unused_concepts_cursor'):
+        if st.button("Load more concepts ⬇️", use_container_width=True):
+            load_more_unused_concepts(api_client, days_before)
+            st.rerun()
+
 if __name__ == "__main__":
     if st.session_state.get("logged_in", False):
         main()
@@ -1,6 +1,6 @@
 import streamlit as st
 from src.frontend.components.sidebar import show_api_keys, show_model_choice, show_prompt, show_error_details
-from src.frontend.components.concepts import get_link_preview, show_keywords_as_pills
+from src.frontend.components.concepts import get_link_preview, show_keywords_as_pills, reset_unused_concepts
 from src.frontend.api_client import EchoAPIClient
 from src.backend.tweets.prompts import thread_n_tweets_prompt, footer_prompt
 
@@ -137,6 +137,7 @@ def main():
             if st.button("Mark as Used & Exit 🗑️", use_container_width=True):
                 if api_client.mark_concept_as_used(concept_id=concept['id']):
                     st.success("Concept marked as used!")
+                    reset_unused_concepts()
                     st.switch_page("pages/1_📚_Explore_Concepts.py")
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+"""
+Benchmark the per-request cost of building a ChromaDatabase.
+
+Compares the legacy setup, where every request opened its own
+PersistentClient, embedding function and collection handle, against the
+process-wide registry, on a throwaway persist directory. No embeddings are
+computed, so no API key is needed.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_chroma_registry.py --requests 200
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import chromadb
+from chromadb.utils.embedding_functions.openai_embedding_function import OpenAIEmbeddingFunction
+
+from src.backend.database.vector import ChromaDatabase
+from src.backend.database.chroma_registry import close_all_clients
+from src.backend.database.pool import close_all_pools
+
+MODEL = "text-embedding-3-small"
+COLLECTION = "bench_collection"
+
+
+def legacy_request(persist_directory: str) -> None:
+    embedding_function = OpenAIEmbeddingFunction(api_key=os.getenv("OPENAI_API_KEY"), model_name=MODEL)
+    client = chromadb.PersistentClient(path=persist_directory)
+    client.get_or_create_collection(name=COLLECTION, embedding_function=embedding_function)
+
+
+def registry_request(persist_directory: str) -> None:
+    ChromaDatabase(embedding_model_name=MODEL, persist_directory=persist_directory, collection_name=COLLECTION)
+
+
+def measure(request, persist_directory: str, requests: int) -> list[float]:
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        request(persist_directory)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def describe(label: str, timings: list[float]) -> str:
+    return f"{label:>8}: median {statistics.median(timings) * 1000:8.3f} ms, mean {statistics.mean(timings) * 1000:8.3f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="ChromaDatabase constructions per setup")
+    args = parser.parse_args()
+    os.environ.setdefault("OPENAI_API_KEY", "sk-bench")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = measure(legacy_request, tmp, args.requests)
+        registry = measure(registry_request, tmp, args.requests)
+        close_all_clients()
+        close_all_pools()
+
+    print(describe("legacy", legacy))
+    print(describe("registry", registry))
+    print(f"speedup: {statistics.median(legacy) / statistics.median(registry):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Check that a running ingestion does not stall other requests.
+
+Measures /user/username latency on its own and while a
+/fetch-and-generate-concepts job is running. Gmail, Chroma and the LLM are
+replaced by fakes that block for a fixed time, so no credentials or network
+are needed.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_event_loop.py
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import httpx
+
+import src.backend.main as main
+import src.backend.jobs.ingestion as ingestion
+from src.backend.database.sql import SQLDatabase
+from src.backend.concepts.cache import ExtractionCache
+
+EMAILS = 20
+GMAIL_LATENCY = 0.05
+LLM_LATENCY = 0.2
+
+
+class FakeEmailFetcher:
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+    def get_history_id(self, user_id="me"):
+        return None
+
+    def list_messages(self, only_unread=True, recipients=[]):
+        time.sleep(GMAIL_LATENCY)
+        yield from (f"fake-{i}" for i in range(EMAILS))
+
+    def get_raw_messages(self, user_id, msg_ids):
+        time.sleep(GMAIL_LATENCY)
+        return [{"id": msg_id} for msg_id in msg_ids]
+
+    def format_message(self, raw_message):
+        return {
+            "id": raw_message["id"],
+            "subject": "Fake newsletter",
+            "sender": "news@example.com",
+            "date": "Mon, 05 Oct 2026 10:00:00 +0000",
+            "snippet": "",
+            "body": "Fake body",
+        }
+
+
+class FakeChromaDatabase:
+    def __init__(self, **kwargs):
+        pass
+
+
+class FakeConceptExtractor:
+    def __init__(self, sql_db, **kwargs):
+        self.sql_db = sql_db
+        self.raw_tokens = 0
+        self.prompt_tokens = 0
+        self.cache = ExtractionCache(sql_db=sql_db)
+
+    def process_email_concepts(self, email_data, similarity_threshold_limit, user_id, chroma_collection_id=None):
+        time.sleep(LLM_LATENCY)
+        self.sql_db.persist_email_concepts(email_id=email_data["id"], concepts=[], user_id=user_id)
+        return True, 0
+
+    def process_emails_concepts(self, emails, similarity_threshold_limit, user_id, chroma_collection_id=None):
+        for email_data in emails:
+            yield (email_data, *self.process_email_concepts(email_data, similarity_threshold_limit, user_id, chroma_collection_id))
+
+
+async def sample_latency(client: httpx.AsyncClient, user_id: int, samples: int) -> list[float]:
+    # Latency is measured from when the request was due, so time spent
+    # waiting for a blocked event loop to wake us up counts too.
+    latencies = []
+    for _ in range(samples):
+        due = time.perf_counter() + 0.02
+        await asyncio.sleep(0.02)
+        response = await client.get("/user/username", params={"user_id": user_id})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - due)
+    return latencies
+
+
+def describe(label: str, latencies: list[float]) -> str:
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    return f"{label:>18}: median {statistics.median(ordered) * 1000:7.1f} ms, p95 {p95 * 1000:7.1f} ms, max {ordered[-1] * 1000:7.1f} ms"
+
+
+async def run() -> None:
+    ingestion.EmailFetcher = FakeEmailFetcher
+    ingestion.ChromaDatabase = FakeChromaDatabase
+    ingestion.ConceptExtractor = FakeConceptExtractor
+
+    db = SQLDatabase()
+    db.migrate()
+    user_id = db.create_user(f"bench_{time.time_ns()}", "bench")
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        idle = await sample_latency(client, user_id, 50)
+
+        response = await client.post(
+            "/fetch-and-generate-concepts",
+            params={"user_id": user_id},
+            json={"user_id": user_id, "model_name": "fake", "embedding_model_name": "fake"},
+        )
+        response.raise_for_status()
+        job_id = response.json()["job_id"]
+
+        busy = []
+        while True:
+            busy.extend(await sample_latency(client, user_id, 5))
+            job = (await client.get(f"/jobs/{job_id}", params={"user_id": user_id})).json()
+            if job["status"] in ("completed", "failed"):
+                break
+
+    print(describe("idle", idle))
+    print(describe("during ingestion", busy))
+    print(f"job {job['status']}: {job['emails_fetched']} fetched, {job['emails_processed']} processed")
+
+
+def main_cli():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,161 @@
+"""
+Count Gmail API round trips when fetching messages.
+
+Lists every message (following page tokens), then runs the per-message path
+(messages.get + messages.modify per email) and the batched path (one batch
+request per 100 messages plus one batchModify) against a fake Gmail service
+that counts HTTP round trips and adds a fixed latency to each. No credentials
+or network are needed.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_gmail_batch.py --messages 1200 --latency 0.05
+"""
+import argparse
+import base64
+import os
+import time
+
+# Measure round trips, not the client-side Gmail quota pacing
+os.environ.setdefault("GMAIL_QUOTA_UNITS_PER_SECOND", "1000000")
+
+from src.backend.gmail_reader.email_fetcher import EmailFetcher
+
+
+class FakeRequest:
+    def __init__(self, service, method, **kwargs):
+        self.service = service
+        self.method = method
+        self.kwargs = kwargs
+
+    def run(self):
+        """Produce the response without counting a round trip (used inside batches)."""
+        return self.service.respond(self.method, **self.kwargs)
+
+    def execute(self):
+        self.service.round_trip()
+        return self.run()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        if len(self.requests) >= 100:
+            raise ValueError("Gmail batches are limited to 100 calls")
+        self.requests.append((request_id or str(len(self.requests)), request, callback or self.callback))
+
+    def execute(self):
+        self.service.round_trip()
+        for request_id, request, callback in self.requests:
+            callback(request_id, request.run(), None)
+
+
+class FakeMessages:
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, **kwargs):
+        return FakeRequest(self.service, "list", **kwargs)
+
+    def get(self, **kwargs):
+        return FakeRequest(self.service, "get", **kwargs)
+
+    def modify(self, **kwargs):
+        return FakeRequest(self.service, "modify", **kwargs)
+
+    def batchModify(self, **kwargs):
+        return FakeRequest(self.service, "batchModify", **kwargs)
+
+
+class FakeUsers:
+    def __init__(self, service):
+        self.service = service
+
+    def messages(self):
+        return FakeMessages(self.service)
+
+
+class FakeGmailService:
+    """Just enough of the Gmail API resource for EmailFetcher, counting round trips."""
+
+    def __init__(self, n_messages: int, latency: float):
+        self.ids = [f"msg-{i}" for i in range(n_messages)]
+        self.unread = set(self.ids)
+        self.latency = latency
+        self.round_trips = 0
+
+    def round_trip(self):
+        self.round_trips += 1
+        time.sleep(self.latency)
+
+    def users(self):
+        return FakeUsers(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def respond(self, method, **kwargs):
+        if method == "list":
+            start = int(kwargs.get("pageToken") or 0)
+            end = start + kwargs.get("maxResults", 100)
+            response = {"messages": [{"id": msg_id} for msg_id in self.ids[start:end]]}
+            if end < len(self.ids):
+                response["nextPageToken"] = str(end)
+            return response
+        if method == "get":
+            body = base64.urlsafe_b64encode(f"Body of {kwargs['id']}".encode()).decode()
+            return {
+                "id": kwargs["id"],
+                "snippet": "",
+                "payload": {
+                    "headers": [
+                        {"name": "Subject", "value": f"Newsletter {kwargs['id']}"},
+                        {"name": "From", "value": "news@example.com"},
+                        {"name": "Date", "value": "Mon, 05 Oct 2026 10:00:00 +0000"},
+                    ],
+                    "parts": [{"mimeType": "text/plain", "body": {"data": body}}],
+                },
+            }
+        if method == "modify":
+            self.unread.discard(kwargs["id"])
+        if method == "batchModify":
+            self.unread.difference_update(kwargs["body"]["ids"])
+        return {}
+
+
+def run(path: str, n_messages: int, latency: float) -> None:
+    service = FakeGmailService(n_messages, latency)
+    fetcher = EmailFetcher.model_construct(service=service, user_id=None)
+    ids = list(fetcher.list_messages(only_unread=False))
+    list_round_trips = service.round_trips
+
+    start = time.perf_counter()
+    if path == "per-message":
+        raw_messages = [fetcher.get_raw_message("me", msg_id) for msg_id in ids]
+    else:
+        raw_messages = list(fetcher.get_raw_messages("me", ids))
+    elapsed = time.perf_counter() - start
+
+    formatted = [fetcher.format_message(raw) for raw in raw_messages]
+    ok = sum(1 for message in formatted if "error" not in message)
+    print(
+        f"{path:>11}: {list_round_trips} list page(s), {service.round_trips - list_round_trips:4d} fetch round trips for {ok} messages, "
+        f"{len(service.unread)} left unread, {elapsed:6.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1200)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to each round trip")
+    args = parser.parse_args()
+
+    run("per-message", args.messages, args.latency)
+    run("batched", args.messages, args.latency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark the local ONNX embedding backend on CPU.
+
+Embeds synthetic concept-sized texts with all-MiniLM-L6-v2 at several batch
+sizes and reports the latency per text. The model is downloaded to
+ECHO_ONNX_MODEL_DIR on first use; after that the benchmark runs offline.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_local_embeddings.py --texts 256
+"""
+import argparse
+import time
+
+from src.backend.database.embedding_providers import create_embedding_function
+
+MODEL = "all-MiniLM-L6-v2"
+
+
+def make_texts(n: int) -> list[str]:
+    return [
+        f"Concept {i}: a new open-weight language model was released this week, "
+        f"with benchmark results, licensing details and pricing for hosted inference."
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=256, help="Texts to embed per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32], help="Batch sizes to measure")
+    args = parser.parse_args()
+
+    embedding_function = create_embedding_function(MODEL)
+    texts = make_texts(args.texts)
+    embedding_function(texts[:1])  # load the model before timing
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(texts), batch_size):
+            embedding_function(texts[i:i + batch_size])
+        elapsed = time.perf_counter() - start
+        print(f"batch {batch_size:>3}: {elapsed / len(texts) * 1000:7.2f} ms per text, {len(texts) / elapsed:8.1f} texts/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Measure .mbox parsing throughput.
+
+Writes a synthetic archive of multipart newsletters (plain text and HTML
+alternatives, base64 encoded, some with an attachment), then parses it with
+mailbox.mbox in one process and with EmailLoader at 1, 4 and N workers,
+reporting messages per second. Every run is checked to produce the same
+messages, in the same order, as mailbox.mbox.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_mbox_parse.py --messages 20000 [--workers 8]
+"""
+import argparse
+import mailbox
+import os
+import tempfile
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from src.backend.gmail_loader.email_loader import EmailLoader
+
+
+def write_archive(path: str, n_messages: int) -> None:
+    paragraph = "Today's issue covers vector databases, retrieval and evaluation. " * 20
+    archive = mailbox.mbox(path)
+    archive.lock()
+    try:
+        for i in range(n_messages):
+            message = MIMEMultipart("mixed")
+            message["Subject"] = f"Newsletter #{i}"
+            message["From"] = f"news{i % 50}@example.com"
+            message["Date"] = "Mon, 05 Oct 2026 10:00:00 +0000"
+            message["Message-ID"] = f"<{i}@example.com>"
+            alternative = MIMEMultipart("alternative")
+            alternative.attach(MIMEText(f"{i}: {paragraph}\nFrom the archive", "plain", "utf-8"))
+            alternative.attach(MIMEText(f"<p>{i}: {paragraph}</p>", "html", "utf-8"))
+            message.attach(alternative)
+            if i % 10 == 0:
+                message.attach(MIMEApplication(os.urandom(4096), Name="report.pdf"))
+            archive.add(message)
+        archive.flush()
+    finally:
+        archive.unlock()
+        archive.close()
+
+
+def parse_with_mailbox(path: str) -> list[dict]:
+    loader = EmailLoader(workers=1)
+    return [formatted for formatted in map(loader.format_message, mailbox.mbox(path)) if formatted]
+
+
+def timed(label: str, n_messages: int, parse) -> list[dict]:
+    start = time.perf_counter()
+    messages = parse()
+    elapsed = time.perf_counter() - start
+    print(f"{label:>16}: {len(messages):6d} messages in {elapsed:6.2f} s, {len(messages) / elapsed:8.0f} messages/s")
+    return messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="N, the largest worker count to try")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.mbox")
+        write_archive(path, args.messages)
+        print(f"Archive: {args.messages} messages, {os.path.getsize(path) / 1024 ** 2:.1f} MiB, {os.cpu_count()} CPU(s)")
+
+        expected = timed("mailbox.mbox", args.messages, lambda: parse_with_mailbox(path))
+        for workers in sorted({1, 4, args.workers}):
+            loader = EmailLoader(workers=workers)
+            messages = timed(f"{workers} worker(s)", args.messages, lambda: list(loader.process_mbox_file(path)))
+            if messages != expected:
+                raise SystemExit(f"{workers} worker(s) produced different messages than mailbox.mbox")
+
+
+if __name__ == "__main__":
+    main()
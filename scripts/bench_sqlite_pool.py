@@ -0,0 +1,114 @@
+"""
+Benchmark /concepts/unused read throughput while an ingestion is writing.
+
+Compares the pooled WAL connections against the legacy connection-per-call
+setup on a throwaway database.
+
+Usage:
+    PYTHONPATH=. python scripts/bench_sqlite_pool.py --readers 16 --seconds 10
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+from src.backend.database.sql import SQLDatabase
+from src.backend.database.pool import close_all_pools
+from src.backend.schemas.llm import Concept
+
+
+def seed(db: SQLDatabase, n_concepts: int) -> int:
+    user_id = db.create_user("bench", "bench")
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    for i in range(n_concepts):
+        concept = Concept(
+            title=f"Concept {i}",
+            concept_text=f"Benchmark concept number {i}",
+            keywords=["bench"],
+            links=[],
+            centrality="medium",
+            source_email_date=now,
+        )
+        db.store_concept(concept=concept, chroma_id=f"bench_{i}", user_id=user_id)
+    return user_id
+
+
+def run(use_pool: bool, readers: int, seconds: float, n_concepts: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        seed_db = SQLDatabase(db_path=db_path, use_pool=use_pool)
+        seed_db.migrate()
+        user_id = seed(seed_db, n_concepts)
+
+        stop = threading.Event()
+        counts = {"reads": 0, "writes": 0, "read_errors": 0}
+        lock = threading.Lock()
+
+        def reader():
+            done = errors = 0
+            while not stop.is_set():
+                # Every request builds its own SQLDatabase, as the endpoints do.
+                db = SQLDatabase(db_path=db_path, use_pool=use_pool)
+                result = db.get_unused_concepts_for_tweets(user_id=user_id, days_before=30)
+                if result is False:
+                    errors += 1
+                else:
+                    done += 1
+            with lock:
+                counts["reads"] += done
+                counts["read_errors"] += errors
+
+        def writer():
+            db = SQLDatabase(db_path=db_path, use_pool=use_pool)
+            i = 0
+            while not stop.is_set():
+                db.store_email({
+                    "id": f"bench-email-{i}",
+                    "subject": "Bench",
+                    "sender": "bench@example.com",
+                    "date": format_datetime(datetime.now(timezone.utc)),
+                    "snippet": "bench",
+                    "body": "bench " * 200,
+                }, user_id)
+                i += 1
+            with lock:
+                counts["writes"] += i
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads.append(threading.Thread(target=writer))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        close_all_pools()
+
+    return {
+        "mode": "pooled WAL" if use_pool else "connection per call",
+        "reads_per_sec": counts["reads"] / seconds,
+        "writes_per_sec": counts["writes"] / seconds,
+        "read_errors": counts["read_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concepts", type=int, default=2000)
+    args = parser.parse_args()
+
+    for use_pool in (False, True):
+        result = run(use_pool, args.readers, args.seconds, args.concepts)
+        print(
+            f"{result['mode']:>20}: {result['reads_per_sec']:8.1f} reads/s, "
+            f"{result['writes_per_sec']:8.1f} writes/s, {result['read_errors']} failed reads"
+        )
+
+
+if __name__ == "__main__":
+    main()
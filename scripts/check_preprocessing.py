@@ -0,0 +1,68 @@
+"""
+Regression check for the email cleaning done before concept extraction.
+
+Runs clean_text on sample newsletters and exits non-zero if a footer or
+bare link line survives, or if a content paragraph that merely mentions a
+boilerplate phrase (a privacy policy, an address something was sent to) is
+dropped.
+
+Usage:
+    PYTHONPATH=. python scripts/check_preprocessing.py
+"""
+import sys
+
+from src.backend.concepts.preprocessing import clean_text
+
+NEWSLETTER = """\
+View this email in your browser (https://example.com/view)
+
+Meta rewrites its privacy policy
+
+Meta is rewriting its privacy policy to let it train models on public posts from European users, after regulators asked it to pause the rollout last year. Users will be able to object through a form in the app settings.
+
+Apple has asked app makers to stop collecting device fingerprints. The notice, sent to developers@apple.com subscribers on Monday, lists the APIs that now need a declared reason.
+
+Unsubscribe
+
+That's all for today.
+
+You are receiving this because you subscribed to Tech Weekly.
+Sent to reader@example.com
+Unsubscribe (https://example.com/u) | Manage preferences
+© 2026 Tech Weekly. All rights reserved.
+Privacy policy
+"""
+
+MUST_KEEP = [
+    "Meta rewrites its privacy policy",
+    "Meta is rewriting its privacy policy",
+    "sent to developers@apple.com subscribers",
+    "That's all for today.",
+]
+
+MUST_DROP = [
+    "View this email in your browser",
+    "Unsubscribe",
+    "You are receiving this",
+    "Sent to reader@example.com",
+    "All rights reserved",
+    "Privacy policy",
+]
+
+
+def main() -> int:
+    cleaned = clean_text(NEWSLETTER)
+    failures = [f"dropped content: {text!r}" for text in MUST_KEEP if text not in cleaned]
+    failures += [f"kept boilerplate: {text!r}" for text in MUST_DROP if text in cleaned]
+    if failures:
+        print(f"{len(failures)} preprocessing check(s) failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        print(f"Cleaned text:\n{cleaned}")
+        return 1
+    print(f"Checked {len(MUST_KEEP)} content and {len(MUST_DROP)} boilerplate snippets")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
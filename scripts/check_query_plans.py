@@ -0,0 +1,89 @@
+"""
+Query-plan regression check for the SQLite statements.
+
+Builds the schema from the migrations in an in-memory database, runs
+EXPLAIN QUERY PLAN on every statement defined in sql_statements.py and every
+SQL literal in sql.py, and exits non-zero if any of them full-scans a table.
+
+Usage:
+    PYTHONPATH=. python scripts/check_query_plans.py
+"""
+import ast
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+from src.backend.database import sql_statements
+from src.backend.database.migrations import run_migrations
+
+DATABASE_DIR = Path(__file__).resolve().parent.parent / "src" / "backend" / "database"
+SQL_PATTERN = re.compile(r"^\s*(SELECT|UPDATE|DELETE|INSERT|REPLACE|WITH)\b")
+
+# Statements that read or rewrite a whole table on purpose.
+ALLOWED_SCANS = {
+    "SELECT * FROM emails": "full export in get_tables_in_dataframes",
+    "SELECT * FROM tweets": "full export in get_tables_in_dataframes",
+    "SELECT * FROM concepts": "full export in get_tables_in_dataframes",
+    "SELECT id, username, chroma_collection_id, created_at, last_login FROM users": "list_users admin listing",
+    "SELECT_UNPROCESSED_EMAILS": "unused, not scoped to a user",
+    "GET_RECENT_CONCEPTS": "unused",
+    "NORMALIZE_CONCEPT_DATES": "one-off migration",
+    "NORMALIZE_EMAIL_DATES": "one-off migration",
+    "EVICT_EXCESS_EXTRACTIONS": "walks the last_used_at index to find entries past the size limit",
+}
+
+
+def _normalize(statement: str) -> str:
+    return " ".join(statement.split()).rstrip(";")
+
+
+def collect_statements() -> list[tuple[str, str]]:
+    """Return (label, sql) pairs for every DML statement we ship."""
+    statements = []
+    for name, value in vars(sql_statements).items():
+        if name.isupper() and isinstance(value, str) and SQL_PATTERN.match(value):
+            statements.append((name, value))
+
+    tree = ast.parse((DATABASE_DIR / "sql.py").read_text())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_PATTERN.match(node.value):
+            statements.append((f"sql.py:{node.lineno}", node.value))
+    return statements
+
+
+def scans_in_plan(conn: sqlite3.Connection, statement: str) -> list[str]:
+    # IN lists built at runtime are planned with a single parameter
+    statement = statement.replace("{placeholders}", "?")
+    params = (None,) * statement.count("?")
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {statement}", params).fetchall()
+    return [row[3] for row in plan if row[3].startswith("SCAN ") and row[3] != "SCAN CONSTANT ROW"]
+
+
+def main() -> int:
+    conn = sqlite3.connect(":memory:")
+    run_migrations(conn)
+
+    failures = []
+    statements = collect_statements()
+    for label, statement in statements:
+        normalized = _normalize(statement)
+        try:
+            scans = scans_in_plan(conn, statement)
+        except sqlite3.Error as e:
+            failures.append(f"{label}: failed to plan ({e}): {normalized}")
+            continue
+        if scans and label not in ALLOWED_SCANS and normalized not in ALLOWED_SCANS:
+            failures.append(f"{label}: {', '.join(scans)}: {normalized}")
+
+    if failures:
+        print(f"{len(failures)} statement(s) regressed to a full table scan:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"Checked {len(statements)} statements, no unexpected table scans")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
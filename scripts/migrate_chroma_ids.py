@@ -0,0 +1,91 @@
+"""
+Rewrite existing concept IDs to the content-addressed format.
+
+Concepts stored before content-addressed IDs have IDs like
+concept_20250101_120000_1234. For every user this re-adds each Chroma record
+under its new ID (keeping the stored embedding, so nothing is re-embedded),
+renames the matching chroma_id in the concepts table and then deletes the
+old record. Records whose text maps to an ID that is already taken keep
+their old ID. Running the script again is a no-op.
+
+Stop the backend before running it.
+
+Usage:
+    PYTHONPATH=. python scripts/migrate_chroma_ids.py [--db-path database/echo_sqlite.db] \
+        [--persist-directory ./database] [--embedding-model text-embedding-ada-002] [--dry-run]
+"""
+import argparse
+
+from src.backend.database.sql import SQLDatabase
+from src.backend.database.vector import make_concept_id
+from src.backend.database.chroma_registry import get_client, close_all_clients
+from src.backend.database.embedding_providers import collection_name_for_model
+
+BATCH_SIZE = 500
+
+
+def plan_renames(collection_name: str, model_name: str, records: dict) -> list[tuple[str, str]]:
+    """Return (old_id, new_id) pairs, skipping records whose new ID is already used."""
+    taken = set(records["ids"])
+    renames = []
+    for old_id, document in zip(records["ids"], records["documents"]):
+        new_id = make_concept_id(collection_name, model_name, document or "")
+        if new_id == old_id or new_id in taken:
+            continue
+        taken.add(new_id)
+        renames.append((old_id, new_id))
+    return renames
+
+
+def migrate_user(db: SQLDatabase, user: dict, persist_directory: str, model_name: str, dry_run: bool) -> int:
+    collection_name = user["chroma_collection_id"]
+    chroma_name = collection_name_for_model(collection_name, model_name)
+    if chroma_name not in get_client(persist_directory).list_collections():
+        return 0
+    # Stored embeddings are reused, so the collection is opened without the model's embedding function
+    collection = get_client(persist_directory).get_collection(chroma_name)
+    records = collection.get(include=["documents", "embeddings", "metadatas"])
+    renames = plan_renames(collection_name, model_name, records)
+    if dry_run or not renames:
+        return len(renames)
+
+    index = {record_id: i for i, record_id in enumerate(records["ids"])}
+    for start in range(0, len(renames), BATCH_SIZE):
+        batch = renames[start:start + BATCH_SIZE]
+        positions = [index[old_id] for old_id, _ in batch]
+        # Add the new records first, so an interrupted run never loses a concept
+        collection.upsert(
+            ids=[new_id for _, new_id in batch],
+            documents=[records["documents"][i] for i in positions],
+            embeddings=[records["embeddings"][i] for i in positions],
+            metadatas=[records["metadatas"][i] for i in positions]
+        )
+        if db.rename_concept_chroma_ids(user["id"], batch) is False:
+            raise RuntimeError(f"Failed to rename concepts of user {user['username']}")
+        collection.delete(ids=[old_id for old_id, _ in batch])
+    return len(renames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=SQLDatabase.model_fields["db_path"].default)
+    parser.add_argument("--persist-directory", default="./database")
+    parser.add_argument("--embedding-model", default="text-embedding-ada-002", help="Model the collections were built with")
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many IDs would change")
+    args = parser.parse_args()
+
+    db = SQLDatabase(db_path=args.db_path, use_pool=False)
+    db.migrate()
+    total = 0
+    for user in db.list_users():
+        if not user["chroma_collection_id"]:
+            continue
+        renamed = migrate_user(db, user, args.persist_directory, args.embedding_model, args.dry_run)
+        total += renamed
+        print(f"{user['username']}: {renamed} concept ID(s) {'to rewrite' if args.dry_run else 'rewritten'}")
+    close_all_clients()
+    print(f"{'Would rewrite' if args.dry_run else 'Rewrote'} {total} concept ID(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,26 @@
- 
\ No newline at end of file
+"""
+Apply pending schema migrations, including the UTC normalization of
+concept and email dates.
+
+The backend runs the same migrations at startup; this script is for
+migrating a database file without starting the API.
+
+Usage:
+    PYTHONPATH=. python scripts/migrate_concepts_date.py [--db-path database/echo_sqlite.db]
+"""
+import argparse
+
+from src.backend.database.sql import SQLDatabase
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db-path", default=SQLDatabase.model_fields["db_path"].default)
+    args = parser.parse_args()
+
+    applied = SQLDatabase(db_path=args.db_path, use_pool=False).migrate()
+    print(f"Applied {applied} migration(s) to {args.db_path}")
+
+
+if __name__ == "__main__":
+    main()
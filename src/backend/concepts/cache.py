@@ -0,0 +1,85 @@
+"""
+Persistent cache of LLM concept extractions.
+
+Entries are keyed by a hash of the normalized chunk text, the model name and
+the prompt version, so re-ingesting a newsletter we have already seen costs
+no LLM call. Changing the prompt means bumping its version, which leaves the
+old entries to age out.
+"""
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from ..database.sql import SQLDatabase
+from ..logger import setup_logger
+from ..schemas.llm import ConceptList
+
+logger = setup_logger(__name__)
+
+CACHE_MAX_ENTRIES = int(os.getenv("ECHO_EXTRACTION_CACHE_MAX_ENTRIES", "20000"))
+CACHE_MAX_AGE_DAYS = int(os.getenv("ECHO_EXTRACTION_CACHE_MAX_AGE_DAYS", "90"))
+
+# Source fields are set per email after extraction, so they are not cached
+SOURCE_FIELDS = {"concepts": {"__all__": {"source_email_id", "source_email_date"}}}
+
+_stats = {"hits": 0, "misses": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, value: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += value
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return the process-wide cache counters and hit rate."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+class ExtractionCache(BaseModel):
+    """Reads and writes cached extractions through SQLDatabase."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+    sql_db: SQLDatabase = Field(default=...)
+    max_entries: int = Field(default=CACHE_MAX_ENTRIES)
+    max_age_days: int = Field(default=CACHE_MAX_AGE_DAYS)
+
+    @staticmethod
+    def make_key(content: str, model: str, prompt_version: str) -> str:
+        """Hash the whitespace-normalized content together with the model and prompt version."""
+        normalized = " ".join(content.split())
+        return hashlib.sha256(f"{model}\0{prompt_version}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[ConceptList]:
+        """Return the cached concepts for a key, or None on a miss."""
+        concepts_json = self.sql_db.get_cached_extraction(key)
+        if not concepts_json:
+            _count("misses")
+            return None
+        try:
+            concept_list = ConceptList.model_validate_json(concepts_json)
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable cache entry {key}: {e}")
+            _count("misses")
+            return None
+        _count("hits")
+        return concept_list
+
+    def put(self, key: str, concept_list: ConceptList, model: str, prompt_version: str) -> None:
+        """Cache the concepts extracted for a key."""
+        concepts_json = concept_list.model_dump_json(exclude=SOURCE_FIELDS)
+        self.sql_db.store_cached_extraction(key, model, prompt_version, concepts_json)
+
+    def evict(self) -> int:
+        """Apply the age and size limits and return how many entries were dropped."""
+        evicted = self.sql_db.evict_cached_extractions(self.max_age_days, self.max_entries) or 0
+        if evicted:
+            _count("evictions", evicted)
+            logger.info(f"Evicted {evicted} extraction cache entries")
+        return evicted
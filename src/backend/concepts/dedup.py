@@ -0,0 +1,59 @@
+"""
+Near-duplicate detection within a batch of extracted concepts.
+
+The LLM often returns several paraphrases of the same story from one
+newsletter. Chroma only catches concepts similar to ones already stored, so
+each batch is first clustered on pairwise cosine similarity and only the most
+central concept of each cluster goes on to the Chroma check.
+"""
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+from ..schemas.llm import Concept
+
+CENTRALITY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+
+def cosine_similarity_matrix(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    """Return the pairwise cosine similarity of the given vectors."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1, norms)
+    return matrix @ matrix.T
+
+
+def cluster_concepts(
+    concepts: List[Concept],
+    vectors: Sequence[Sequence[float]],
+    similarity_threshold: float
+) -> List[Tuple[Concept, int]]:
+    """Greedily cluster concepts whose cosine similarity reaches the threshold.
+
+    Concepts are visited from highest to lowest centrality (ties keep input
+    order); each one not yet clustered becomes a representative and absorbs
+    every other unclustered concept similar enough to it.
+
+    Args:
+        concepts: Concepts extracted from one batch
+        vectors: Embedding of each concept's text, in the same order
+        similarity_threshold: Minimum cosine similarity for two concepts to be duplicates
+
+    Returns:
+        (representative, cluster size) pairs, in the input order of the representatives
+    """
+    if len(concepts) < 2:
+        return [(concept, 1) for concept in concepts]
+
+    similarities = cosine_similarity_matrix(vectors)
+    order = sorted(range(len(concepts)), key=lambda i: CENTRALITY_RANK.get(concepts[i].centrality, len(CENTRALITY_RANK)))
+    assigned = np.zeros(len(concepts), dtype=bool)
+    clusters = {}
+    for i in order:
+        if assigned[i]:
+            continue
+        members = ~assigned & (similarities[i] >= similarity_threshold)
+        members[i] = True
+        assigned |= members
+        clusters[i] = int(members.sum())
+    return [(concepts[i], clusters[i]) for i in sorted(clusters)]
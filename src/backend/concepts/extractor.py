@@ -1,38 +1,70 @@
 from langchain_core.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Any, Tuple, Optional
+from typing import Any, Dict, Tuple, Optional, Iterable, Iterator
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import requests
 import os
 
 from ..database.vector import ChromaDatabase
 from ..database.sql import SQLDatabase
+from ..concurrency import provider_slot
+from ..ratelimit import call_with_retry, key_id
+from .preprocessing import prepare_email
+from .cache import ExtractionCache
+from .dedup import cluster_concepts
 from ..logger import setup_logger
-from ..schemas.llm import ConceptList
+from ..schemas.llm import Concept, ConceptList
 
 logger = setup_logger(__name__)
 
+EXTRACTION_CONCURRENCY = int(os.getenv("ECHO_EXTRACTION_CONCURRENCY", "4"))
+
+EXTRACTION_PROMPT = "Extract key concepts from the following newsletter content. Each concept text should be paragraph long.\n\n{email_content}"
+# Bump whenever EXTRACTION_PROMPT or ConceptList changes, so cached extractions are not reused
+PROMPT_VERSION = "1"
+
 class ConceptExtractor(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True, extra='allow')
     model: str = Field(default=...)
     sql_db: SQLDatabase = Field(default=...)
     vector_db: ChromaDatabase = Field(default=...)
+    max_concurrency: int = Field(default=EXTRACTION_CONCURRENCY)
     
     def model_post_init(self, __context: Any) -> None:
+        # Retries are left to call_with_retry, which shares backoff across threads
         if 'deepseek' in self.model:
-            self.llm = ChatOpenAI(api_key=os.getenv("DEEPSEEK_API_KEY"), model='deepseek-chat', base_url='https://api.deepseek.com/')
+            self.provider = 'deepseek'
+            self.api_key = os.getenv("DEEPSEEK_API_KEY")
+            self.llm = ChatOpenAI(api_key=self.api_key, model='deepseek-chat', base_url='https://api.deepseek.com/', max_retries=0)
         else:
-            self.llm = ChatOpenAI(api_key=os.getenv("OPENAI_API_KEY"), model=self.model)
+            self.provider = 'openai'
+            self.api_key = os.getenv("OPENAI_API_KEY")
+            self.llm = ChatOpenAI(api_key=self.api_key, model=self.model, max_retries=0)
+        self.cache = ExtractionCache(sql_db=self.sql_db)
+        self.raw_tokens = 0
+        self.prompt_tokens = 0
+        self._token_lock = threading.Lock()
 
     def _extract_concepts(self, email_content: str, email_id: str, email_date: str) -> ConceptList:
-        """Extract concepts from email content using OpenAI."""
+        """Extract concepts from email content using OpenAI, reusing cached extractions."""
         try:
-            prompt = PromptTemplate.from_template(
-                "Extract key concepts from the following newsletter content. Each concept text should be paragraph long.\n\n{email_content}"
-            )
-            chain = prompt | self.llm.with_structured_output(ConceptList)
-            
-            concept_list: ConceptList = chain.invoke({"email_content": email_content})
+            cache_key = self.cache.make_key(email_content, self.model, PROMPT_VERSION)
+            concept_list = self.cache.get(cache_key)
+            if concept_list is not None:
+                logger.info(f"Extraction cache hit for email {email_id}")
+            else:
+                prompt = PromptTemplate.from_template(EXTRACTION_PROMPT)
+                chain = prompt | self.llm.with_structured_output(ConceptList)
+                
+                def invoke():
+                    with provider_slot(self.provider):
+                        return chain.invoke({"email_content": email_content})
+
+                concept_list = call_with_retry(self.provider, key_id(self.api_key), invoke)
+                self.cache.put(cache_key, concept_list, self.model, PROMPT_VERSION)
             
             for concept in concept_list.concepts:
                 concept.source_email_id = email_id
@@ -49,58 +81,141 @@ class ConceptExtractor(BaseModel):
             logger.error(f"Error extracting concepts: {e}", exc_info=True)
             return []
     
-    def process_email_concepts(self, email_data: dict, similarity_threshold_limit: float, user_id: int, chroma_collection_id: Optional[str] = None) -> Tuple[bool, int]:
-        """Process an email to extract and store concepts.
+    def extract_email_concepts(self, email_data: dict) -> ConceptList:
+        """Extract the concepts of an email. Safe to call from several threads.
+        
+        The body is cleaned and split into token-budgeted chunks first; the
+        concepts of every chunk are merged, dropping repeated titles. If any
+        chunk fails, no concepts are returned so the email is retried later.
+        """
+        try:
+            logger.info(f"Extracting concepts from email: {email_data['subject']}")
+            prepared = prepare_email(email_data['subject'], email_data['body'], self.model)
+            with self._token_lock:
+                self.raw_tokens += prepared.raw_tokens
+                self.prompt_tokens += prepared.clean_tokens
+            logger.info(
+                f"Email {email_data['id']}: {prepared.raw_tokens} tokens before preprocessing, "
+                f"{prepared.clean_tokens} after, in {len(prepared.chunks)} chunk(s)"
+            )
+
+            concepts, titles = [], set()
+            for chunk in prepared.chunks:
+                chunk_concepts = self._extract_concepts(chunk, email_data['id'], email_data['date'])
+                if not chunk_concepts:
+                    return []
+                for concept in chunk_concepts.concepts:
+                    title = concept.title.strip().lower()
+                    if title not in titles:
+                        titles.add(title)
+                        concepts.append(concept)
+            return ConceptList(concepts=concepts)
+        except Exception as e:
+            logger.error(f"Error extracting concepts from email: {e}", exc_info=True)
+            return []
+
+    def store_email_concepts(self, email_data: dict, concepts: ConceptList, similarity_threshold_limit: float, user_id: int, chroma_collection_id: Optional[str] = None) -> Tuple[bool, int]:
+        """Store the extracted concepts of an email that are not already known.
         
-        Args:
-            email_data: Dictionary containing email data
-            similarity_threshold_limit: Threshold for concept similarity check
-            user_id: ID of the user who owns the email
-            chroma_collection_id: Optional ID of the user's Chroma collection
-            
         Returns:
             Tuple of (success: bool, stored_count: int)
         """
         try:
-            logger.info(f"Processing concepts for email: {email_data['subject']} for user {user_id} in collection {chroma_collection_id}")
-            
-            email_content = f"Subject: {email_data['subject']}\n\n{email_data['body']}"
-            concepts = self._extract_concepts(email_content, email_data['id'], email_data['date'])
-            
             if not concepts:
                 logger.info("No concepts found in email.")
                 return False, 0
                 
             logger.info(f"Extracted {len(concepts.concepts)} concepts.")
             
-            stored_count = 0
-            for concept in concepts.concepts:
-                chroma_concept_id = self.vector_db.store_concept(
-                    concept=concept, 
-                    similarity_threshold_limit=similarity_threshold_limit,
-                    user_collection_id=chroma_collection_id
-                )
-                
-                if chroma_concept_id:
-                    sql_concept_id = self.sql_db.store_concept(
-                        concept=concept,
-                        chroma_id=chroma_concept_id,
-                        user_id=user_id
-                    )
-                    
-                    if sql_concept_id:
-                        self.sql_db.link_email_to_concept(
-                            email_id=email_data['id'],
-                            concept_id=sql_concept_id,
-                            user_id=user_id,
-                            relevance=concept.centrality
-                        )
-                        stored_count += 1
-            
+            # Merge paraphrases of the same story before checking against Chroma
+            clusters = cluster_concepts(
+                concepts.concepts,
+                self.vector_db.embeddings.embed([concept.concept_text for concept in concepts.concepts]),
+                similarity_threshold_limit
+            )
+            if len(clusters) < len(concepts.concepts):
+                logger.info(f"Merged {len(concepts.concepts) - len(clusters)} near-duplicate concepts.")
+
+            chroma_concept_ids = self.vector_db.store_concepts(
+                concepts=[concept for concept, _ in clusters],
+                similarity_threshold_limit=similarity_threshold_limit,
+                user_collection_id=chroma_collection_id
+            )
+            # Concepts matched to an existing one count as references to it,
+            # together with the near-duplicates merged into them
+            stored: Dict[str, Tuple[Concept, int]] = {}
+            for (concept, references), chroma_concept_id in zip(clusters, chroma_concept_ids):
+                if not chroma_concept_id:
+                    continue
+                if chroma_concept_id in stored:
+                    kept, count = stored[chroma_concept_id]
+                    stored[chroma_concept_id] = (kept, count + references)
+                else:
+                    stored[chroma_concept_id] = (concept, references)
+
+            stored_count = self.sql_db.persist_email_concepts(
+                email_id=email_data['id'],
+                concepts=[(concept, chroma_concept_id) for chroma_concept_id, (concept, _) in stored.items()],
+                user_id=user_id,
+                references=[references for _, references in stored.values()]
+            )
+            if stored_count is False:
+                logger.error(f"Failed to persist concepts for email {email_data['id']}, it will be retried")
+                return False, 0
+
             logger.info(f"Successfully stored {stored_count} new concepts for user {user_id} in collection {chroma_collection_id}")
-            self.sql_db.mark_email_as_processed(email_data['id'])
             return True, stored_count
             
         except Exception as e:
             logger.error(f"Error processing concepts for email: {e}", exc_info=True)
-            return False, 0
\ No newline at end of file
+            return False, 0
+
+    def process_email_concepts(self, email_data: dict, similarity_threshold_limit: float, user_id: int, chroma_collection_id: Optional[str] = None) -> Tuple[bool, int]:
+        """Process an email to extract and store concepts.
+        
+        Args:
+            email_data: Dictionary containing email data
+            similarity_threshold_limit: Threshold for concept similarity check
+            user_id: ID of the user who owns the email
+            chroma_collection_id: Optional ID of the user's Chroma collection
+            
+        Returns:
+            Tuple of (success: bool, stored_count: int)
+        """
+        logger.info(f"Processing concepts for email: {email_data['subject']} for user {user_id} in collection {chroma_collection_id}")
+        concepts = self.extract_email_concepts(email_data)
+        return self.store_email_concepts(email_data, concepts, similarity_threshold_limit, user_id, chroma_collection_id)
+
+    def process_emails_concepts(self, emails: Iterable[dict], similarity_threshold_limit: float, user_id: int, chroma_collection_id: Optional[str] = None) -> Iterator[Tuple[dict, bool, int]]:
+        """Process many emails, running up to max_concurrency LLM extractions at once.
+        
+        Extraction runs on worker threads, but concepts are stored on the
+        calling thread in the order the emails were given, so the dedup
+        against Chroma sees the same sequence as a serial run. With
+        max_concurrency=1 this is exactly the serial loop.
+        
+        Yields:
+            Tuple of (email_data: dict, success: bool, stored_count: int) per email, in order
+        """
+        if self.max_concurrency <= 1:
+            for email_data in emails:
+                yield (email_data, *self.process_email_concepts(email_data, similarity_threshold_limit, user_id, chroma_collection_id))
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="echo-extract") as executor:
+            # Keep a bounded window of extractions ahead of the one being stored
+            pending = deque()
+            emails = iter(emails)
+            while True:
+                while len(pending) < 2 * self.max_concurrency:
+                    email_data = next(emails, None)
+                    if email_data is None:
+                        break
+                    pending.append((email_data, executor.submit(self.extract_email_concepts, email_data)))
+                if not pending:
+                    break
+                email_data, future = pending.popleft()
+                success, stored_count = self.store_email_concepts(
+                    email_data, future.result(), similarity_threshold_limit, user_id, chroma_collection_id
+                )
+                yield email_data, success, stored_count
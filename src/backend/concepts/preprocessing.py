@@ -0,0 +1,215 @@
+"""
+Email preprocessing before concept extraction.
+
+Newsletters usually arrive as HTML full of inline CSS, tracking pixels and
+legal footers. This module turns a body into clean plain text, drops the
+boilerplate lines and splits long newsletters into chunks that fit a token
+budget, so each chunk can be sent to the LLM on its own.
+"""
+import os
+import re
+import threading
+import time
+from typing import Dict, List
+
+import tiktoken
+from bs4 import BeautifulSoup
+from pydantic import BaseModel, Field
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MAX_CHUNK_TOKENS = int(os.getenv("ECHO_MAX_CHUNK_TOKENS", "6000"))
+
+HTML_PATTERN = re.compile(r"<\s*(html|body|div|table|p|br|span|a|td)\b", re.IGNORECASE)
+
+BLOCK_TAGS = ["p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "tr", "table", "blockquote", "section"]
+
+BOILERPLATE_PATTERN = re.compile(
+    r"unsubscribe|view (this email )?in (your )?browser|manage (your )?(email )?preferences|"
+    r"update your preferences|you (are )?receiv(ed|ing) this|forward(ed)? to a friend|"
+    r"all rights reserved|privacy policy|no longer wish to receive|sent to .+@",
+    re.IGNORECASE
+)
+# Footer lines are at most this long; longer lines are content
+FOOTER_MAX_WORDS = 40
+# What is left of a pure link line such as "View in browser | Unsubscribe (https://...)"
+LINK_LINE_LEFTOVER = re.compile(r"\(https?://\S+\)|https?://\S+|[\W_]+")
+
+# Seconds before retrying a tiktoken encoding that failed to load
+ENCODING_RETRY_SECONDS = 60
+
+# Zero-width and padding characters used in newsletter preheaders
+INVISIBLE_CHARS = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff\u034f\u00ad"), None)
+
+
+class PreparedEmail(BaseModel):
+    """Cleaned email text split into prompt-sized chunks."""
+    chunks: List[str] = Field(..., description="Chunks of clean text, each within the token budget")
+    raw_tokens: int = Field(..., description="Tokens in the original subject and body")
+    clean_tokens: int = Field(..., description="Tokens in the cleaned text")
+
+
+class _ApproximateEncoding:
+    """Stand-in used when no tiktoken encoding can be loaded (e.g. offline).
+
+    Treats every four characters as one token, which is close enough for
+    English text to keep chunks within budget.
+    """
+    CHARS_PER_TOKEN = 4
+
+    def encode(self, text: str, **kwargs) -> List[str]:
+        return [text[i:i + self.CHARS_PER_TOKEN] for i in range(0, len(text), self.CHARS_PER_TOKEN)]
+
+    def decode(self, tokens: List[str]) -> str:
+        return "".join(tokens)
+
+
+_encodings: Dict[str, object] = {}
+# Model -> when loading its encoding last failed
+_encoding_failures: Dict[str, float] = {}
+_encoding_lock = threading.Lock()
+
+
+def _load_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _get_encoding(model: str):
+    """Return the tiktoken encoding for a model, or an approximation while it cannot be loaded.
+
+    Only real encodings are cached. After a failure (e.g. no network to
+    download the BPE file) the approximation is used for
+    ENCODING_RETRY_SECONDS, then loading is tried again.
+    """
+    encoding = _encodings.get(model)
+    if encoding is not None:
+        return encoding
+    with _encoding_lock:
+        encoding = _encodings.get(model)
+        if encoding is not None:
+            return encoding
+        failed_at = _encoding_failures.get(model)
+        if failed_at is not None and time.monotonic() - failed_at < ENCODING_RETRY_SECONDS:
+            return _ApproximateEncoding()
+        try:
+            encoding = _encodings[model] = _load_encoding(model)
+            _encoding_failures.pop(model, None)
+            return encoding
+        except Exception as e:
+            logger.warning(f"Could not load tiktoken encoding for {model}, approximating token counts: {e}")
+            _encoding_failures[model] = time.monotonic()
+            return _ApproximateEncoding()
+
+
+def count_tokens(text: str, model: str) -> int:
+    """Count the tokens of a text for a model, falling back to cl100k_base."""
+    return len(_get_encoding(model).encode(text, disallowed_special=()))
+
+
+def html_to_text(html: str) -> str:
+    """Convert an HTML body to plain text, keeping link targets."""
+    soup = BeautifulSoup(html, "lxml")
+    for tag in soup(["script", "style", "head", "title", "noscript", "img", "svg"]):
+        tag.decompose()
+    for tag in soup.find_all(style=re.compile(r"display\s*:\s*none", re.IGNORECASE)):
+        tag.decompose()
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        text = link.get_text(" ", strip=True)
+        if href.startswith("http") and text and href not in text:
+            link.replace_with(f"{text} ({href})")
+    # Break lines only around block elements so inline markup stays on one line
+    for tag in soup.find_all(BLOCK_TAGS):
+        tag.insert_before("\n")
+        tag.insert_after("\n")
+    for tag in soup.find_all("br"):
+        tag.replace_with("\n")
+    return soup.get_text()
+
+
+def _is_link_line(line: str) -> bool:
+    """Whether a line is nothing but boilerplate links, e.g. "View in browser | Unsubscribe"."""
+    return not LINK_LINE_LEFTOVER.sub("", BOILERPLATE_PATTERN.sub("", line))
+
+
+def _footer_start(lines: List[str]) -> int:
+    """Index where the trailing footer starts, or len(lines) if there is none.
+
+    The footer is the run of trailing paragraphs that each contain a
+    boilerplate line and have no line longer than FOOTER_MAX_WORDS.
+    """
+    start = end = len(lines)
+    while end > 0:
+        while end > 0 and not lines[end - 1]:
+            end -= 1
+        begin = end
+        while begin > 0 and lines[begin - 1]:
+            begin -= 1
+        paragraph = lines[begin:end]
+        if not paragraph or any(len(line.split()) > FOOTER_MAX_WORDS for line in paragraph):
+            break
+        if not any(BOILERPLATE_PATTERN.search(line) for line in paragraph):
+            break
+        start = end = begin
+    return start
+
+
+def clean_text(text: str) -> str:
+    """Normalize whitespace and drop boilerplate such as unsubscribe footers.
+
+    Boilerplate phrases only remove a line when it is a bare link line or
+    part of the trailing footer, so content that mentions e.g. a privacy
+    policy is kept.
+    """
+    text = text.translate(INVISIBLE_CHARS).replace("\u00a0", " ")
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    lines = [
+        line for line in lines[:_footer_start(lines)]
+        if not (line and BOILERPLATE_PATTERN.search(line) and _is_link_line(line))
+    ]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def chunk_text(text: str, model: str, max_tokens: int = MAX_CHUNK_TOKENS) -> List[str]:
+    """Split text into chunks of at most max_tokens, breaking between paragraphs where possible."""
+    encoding = _get_encoding(model)
+    chunks, current, current_tokens = [], [], 0
+    for paragraph in text.split("\n\n"):
+        tokens = encoding.encode(paragraph, disallowed_special=())
+        if len(tokens) > max_tokens:
+            # A single paragraph over budget is split on token boundaries
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            for start in range(0, len(tokens), max_tokens):
+                chunks.append(encoding.decode(tokens[start:start + max_tokens]))
+            continue
+        if current and current_tokens + len(tokens) > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(paragraph)
+        current_tokens += len(tokens)
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def prepare_email(subject: str, body: str, model: str, max_tokens: int = MAX_CHUNK_TOKENS) -> PreparedEmail:
+    """Clean an email body and split it into chunks that each start with the subject."""
+    raw = f"Subject: {subject}\n\n{body}"
+    text = html_to_text(body) if HTML_PATTERN.search(body or "") else (body or "")
+    text = clean_text(text)
+
+    header = f"Subject: {subject}\n\n"
+    budget = max(max_tokens - count_tokens(header, model), 1)
+    chunks = [header + chunk for chunk in chunk_text(text, model, budget)] or [header.strip()]
+    return PreparedEmail(
+        chunks=chunks,
+        raw_tokens=count_tokens(raw, model),
+        clean_tokens=sum(count_tokens(chunk, model) for chunk in chunks)
+    )
@@ -0,0 +1,59 @@
+"""
+Concurrency limits for blocking work.
+
+Bounded thread pools for blocking work called from async FastAPI handlers,
+and process-wide in-flight limits for calls to external providers.
+
+sqlite3, the Gmail client, the LLM clients and Chroma are all synchronous.
+Calling them directly inside an `async def` route blocks the event loop, so
+routes hand them to run_blocking(), which runs them on worker threads with a
+separate concurrency limit per subsystem. A slow LLM call then only occupies
+an "llm" slot instead of stalling every other request.
+"""
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Dict, Iterator
+
+from anyio import CapacityLimiter, to_thread
+
+SUBSYSTEM_LIMITS = {
+    "sqlite": int(os.getenv("ECHO_SQLITE_THREADS", "16")),
+    "vector": int(os.getenv("ECHO_VECTOR_THREADS", "8")),
+    "llm": int(os.getenv("ECHO_LLM_THREADS", "8")),
+    "disk": int(os.getenv("ECHO_DISK_THREADS", "4")),
+}
+
+_limiters: Dict[str, CapacityLimiter] = {}
+
+
+def get_limiter(subsystem: str) -> CapacityLimiter:
+    """Return the limiter for a subsystem. Must be called from the event loop."""
+    limiter = _limiters.get(subsystem)
+    if limiter is None:
+        limiter = _limiters[subsystem] = CapacityLimiter(SUBSYSTEM_LIMITS[subsystem])
+    return limiter
+
+
+async def run_blocking(subsystem: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking callable on a worker thread without blocking the event loop."""
+    return await to_thread.run_sync(partial(func, *args, **kwargs), limiter=get_limiter(subsystem))
+
+
+PROVIDER_MAX_IN_FLIGHT = {
+    "openai": int(os.getenv("OPENAI_MAX_IN_FLIGHT", "8")),
+    "deepseek": int(os.getenv("DEEPSEEK_MAX_IN_FLIGHT", "8")),
+}
+
+_provider_slots = {
+    provider: threading.BoundedSemaphore(limit)
+    for provider, limit in PROVIDER_MAX_IN_FLIGHT.items()
+}
+
+
+@contextmanager
+def provider_slot(provider: str) -> Iterator[None]:
+    """Hold one of the provider's in-flight slots, shared by every thread in the process."""
+    with _provider_slots[provider]:
+        yield
@@ -0,0 +1,89 @@
+"""
+Process-wide registry of Chroma clients, embedding functions and collections.
+
+Endpoints build a ChromaDatabase per request. Opening a PersistentClient
+validates the tenant and database against the on-disk metadata, and fetching
+a collection is another round trip, so both are done once per process and
+reused: one client per persist directory, one embedding function per model,
+and one collection handle per (directory, collection, model).
+"""
+import os
+import threading
+from typing import Dict, Tuple
+
+import chromadb
+from chromadb import Collection, EmbeddingFunction
+from chromadb.api import ClientAPI
+from chromadb.api.shared_system_client import SharedSystemClient
+
+from .embedding_providers import create_embedding_function, collection_name_for_model
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_clients: Dict[str, ClientAPI] = {}
+_embedding_functions: Dict[str, EmbeddingFunction] = {}
+_collections: Dict[Tuple[str, str, str], Collection] = {}
+_lock = threading.RLock()
+
+
+def get_client(persist_directory: str) -> ClientAPI:
+    """Return the process-wide client for a persist directory."""
+    key = os.path.abspath(persist_directory)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = _clients[key] = chromadb.PersistentClient(path=persist_directory)
+                logger.info(f"Opened Chroma client for {key}")
+    return client
+
+
+def get_embedding_function(model_name: str) -> EmbeddingFunction:
+    """Return the process-wide embedding function for a model."""
+    embedding_function = _embedding_functions.get(model_name)
+    if embedding_function is None:
+        with _lock:
+            embedding_function = _embedding_functions.get(model_name)
+            if embedding_function is None:
+                embedding_function = _embedding_functions[model_name] = create_embedding_function(model_name)
+    return embedding_function
+
+
+def get_collection(persist_directory: str, collection_name: str, model_name: str) -> Collection:
+    """Return the cached handle of a collection for a model, creating it on first use."""
+    key = (os.path.abspath(persist_directory), collection_name, model_name)
+    collection = _collections.get(key)
+    if collection is None:
+        with _lock:
+            collection = _collections.get(key)
+            if collection is None:
+                collection = _collections[key] = get_client(persist_directory).get_or_create_collection(
+                    name=collection_name_for_model(collection_name, model_name),
+                    embedding_function=get_embedding_function(model_name)
+                )
+    return collection
+
+
+def warm_up(persist_directory: str = "./database") -> None:
+    """Open the client for a persist directory ahead of the first request."""
+    get_client(persist_directory)
+
+
+def close_all_clients() -> None:
+    """Drop every cached handle and stop the Chroma systems behind the clients. Call on shutdown."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+        _collections.clear()
+        _embedding_functions.clear()
+    for path, client in clients:
+        try:
+            client._system.stop()
+        except Exception as e:
+            logger.error(f"Error stopping Chroma client for {path}: {e}", exc_info=True)
+    if clients:
+        # Clients for the same path share a system; forget the stopped ones
+        SharedSystemClient.clear_system_cache()
+        logger.info(f"Closed {len(clients)} Chroma client(s)")
@@ -0,0 +1,66 @@
+"""
+Embedding providers selectable through embedding_model_name.
+
+Any Chroma EmbeddingFunction can back a ChromaDatabase. OpenAI models are
+the default. Names listed in LOCAL_MODELS run on CPU through onnxruntime
+instead, which needs no network once the model files are on disk.
+
+Local models produce vectors of a different dimension than the OpenAI ones,
+so their collections get a suffix and never mix with existing ones.
+"""
+import os
+from pathlib import Path
+from typing import Callable, Dict
+
+from chromadb import EmbeddingFunction
+from chromadb.utils.embedding_functions.onnx_mini_lm_l6_v2 import ONNXMiniLM_L6_V2
+from chromadb.utils.embedding_functions.openai_embedding_function import OpenAIEmbeddingFunction
+
+# Where local models are downloaded on first use; point it at a cached
+# directory to run fully offline (e.g. in CI)
+ONNX_MODEL_DIR = os.getenv("ECHO_ONNX_MODEL_DIR", str(Path.home() / ".cache" / "chroma" / "onnx_models"))
+
+MAX_COLLECTION_NAME_LENGTH = 63
+
+
+class LocalMiniLMEmbeddingFunction(ONNXMiniLM_L6_V2):
+    """all-MiniLM-L6-v2 on CPU, embedding documents in batches of 32."""
+    DOWNLOAD_PATH = Path(ONNX_MODEL_DIR) / ONNXMiniLM_L6_V2.MODEL_NAME
+
+    def __init__(self) -> None:
+        super().__init__(preferred_providers=["CPUExecutionProvider"])
+
+
+LOCAL_MODELS: Dict[str, Callable[[], EmbeddingFunction]] = {
+    ONNXMiniLM_L6_V2.MODEL_NAME: LocalMiniLMEmbeddingFunction,
+}
+
+COLLECTION_SUFFIXES = {
+    ONNXMiniLM_L6_V2.MODEL_NAME: "minilm",
+}
+
+
+def is_local_model(model_name: str) -> bool:
+    """Whether a model runs locally instead of through the OpenAI API."""
+    return model_name in LOCAL_MODELS
+
+
+def create_embedding_function(model_name: str) -> EmbeddingFunction:
+    """Build the embedding function for a model name."""
+    if is_local_model(model_name):
+        return LOCAL_MODELS[model_name]()
+    return OpenAIEmbeddingFunction(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        model_name=model_name
+    )
+
+
+def collection_name_for_model(collection_name: str, model_name: str) -> str:
+    """Return the Chroma collection that holds a collection's vectors for a model.
+
+    OpenAI models keep the plain name, so existing collections are reused.
+    """
+    suffix = COLLECTION_SUFFIXES.get(model_name)
+    if not suffix:
+        return collection_name
+    return f"{collection_name[:MAX_COLLECTION_NAME_LENGTH - len(suffix) - 1]}_{suffix}"
@@ -0,0 +1,200 @@
+"""
+Embedding cache shared by every Chroma operation.
+
+Chroma embeds documents itself when given query_texts or documents, which
+meant one concept was embedded for the dedup query, again for the upsert and
+again when generating a tweet. Vectors are now computed once per
+(model, text) and kept in an in-memory LRU backed by a SQLite file next to
+the Chroma data, and Chroma is always handed explicit embeddings.
+
+The SQLite file is bounded too: once it holds more than DISK_CACHE_SIZE
+vectors, the oldest ones are deleted.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, ConfigDict, Field
+
+from .pool import get_pool
+from .embedding_providers import is_local_model
+from ..logger import setup_logger
+from ..ratelimit import call_with_retry, key_id
+
+logger = setup_logger(__name__)
+
+MEMORY_CACHE_SIZE = int(os.getenv("ECHO_EMBEDDING_CACHE_SIZE", "4096"))
+DISK_CACHE_SIZE = int(os.getenv("ECHO_EMBEDDING_DISK_CACHE_SIZE", "200000"))
+# The disk tier is trimmed after this many vectors have been written to it
+EVICT_EVERY = 1000
+
+CREATE_EMBEDDINGS_TABLE = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    model TEXT NOT NULL,
+    text_hash TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (model, text_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_created_at ON embeddings (created_at);
+"""
+
+SELECT_EMBEDDINGS = """
+SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders});
+"""
+
+INSERT_EMBEDDING = """
+INSERT OR IGNORE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?);
+"""
+
+EVICT_OLDEST_EMBEDDINGS = """
+DELETE FROM embeddings
+WHERE rowid IN (
+    SELECT rowid FROM embeddings
+    ORDER BY created_at DESC
+    LIMIT -1 OFFSET ?
+);
+"""
+
+_memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+_memory_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "computed": 0, "disk_evictions": 0}
+# Cache files whose table exists, and vectors written to each since it was last trimmed
+_disk_writes: Dict[str, int] = {}
+
+
+def get_embedding_stats() -> Dict[str, int]:
+    """Return the process-wide embedding cache counters."""
+    with _memory_lock:
+        return dict(_stats, memory_entries=len(_memory))
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(BaseModel):
+    """Computes embeddings through an embedding function, at most once per text and model."""
+    model_config = ConfigDict(arbitrary_types_allowed=True, extra='allow')
+    embedding_function: Callable[[List[str]], Sequence[Any]] = Field(default=...)
+    model_name: str = Field(default=...)
+    persist_directory: str = Field(default="./database")
+    max_memory_entries: int = Field(default=MEMORY_CACHE_SIZE)
+    max_disk_entries: int = Field(default=DISK_CACHE_SIZE)
+
+    def model_post_init(self, __context: Any) -> None:
+        self.path = os.path.abspath(os.path.join(self.persist_directory, "embeddings.sqlite3"))
+        self.pool = get_pool(self.path)
+        # Caches are built per request; the table is created once per process and file
+        with _memory_lock:
+            if self.path in _disk_writes:
+                return
+            conn = self.pool.get_connection()
+            with conn:
+                conn.executescript(CREATE_EMBEDDINGS_TABLE)
+            _disk_writes[self.path] = 0
+
+    def _evict(self) -> None:
+        """Delete the oldest vectors beyond max_disk_entries."""
+        try:
+            conn = self.pool.get_connection()
+            with conn:
+                evicted = conn.execute(EVICT_OLDEST_EMBEDDINGS, (self.max_disk_entries,)).rowcount
+            with _memory_lock:
+                _stats["disk_evictions"] += evicted
+            if evicted:
+                logger.info(f"Evicted {evicted} cached embeddings from {self.path}")
+        except sqlite3.Error as e:
+            logger.error(f"Error evicting cached embeddings: {e}", exc_info=True)
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        with _memory_lock:
+            _memory[key] = vector
+            _memory.move_to_end(key)
+            while len(_memory) > self.max_memory_entries:
+                _memory.popitem(last=False)
+
+    def _load(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        try:
+            conn = self.pool.get_connection()
+            rows = conn.execute(
+                SELECT_EMBEDDINGS.format(placeholders=", ".join("?" * len(hashes))),
+                (self.model_name, *hashes)
+            ).fetchall()
+            return {row["text_hash"]: np.frombuffer(row["vector"], dtype=np.float32) for row in rows}
+        except sqlite3.Error as e:
+            logger.error(f"Error reading cached embeddings: {e}", exc_info=True)
+            return {}
+
+    def _save(self, vectors: Dict[str, np.ndarray]) -> None:
+        try:
+            conn = self.pool.get_connection()
+            with conn:
+                conn.executemany(
+                    INSERT_EMBEDDING,
+                    [(self.model_name, text_hash, vector.tobytes()) for text_hash, vector in vectors.items()]
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Error writing cached embeddings: {e}", exc_info=True)
+            return
+        with _memory_lock:
+            _disk_writes[self.path] += len(vectors)
+            due = _disk_writes[self.path] >= EVICT_EVERY
+            if due:
+                _disk_writes[self.path] = 0
+        if due:
+            self._evict()
+
+    def _compute(self, texts: List[str]) -> Sequence[Sequence[float]]:
+        """Run the embedding function, through the OpenAI rate limiter unless the model is local."""
+        if is_local_model(self.model_name):
+            return self.embedding_function(texts)
+        return call_with_retry("openai", key_id(os.getenv("OPENAI_API_KEY")), self.embedding_function, texts)
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Return one embedding per text, computing only the ones never seen before.
+
+        Missing texts are sent to the embedding function in a single call.
+        """
+        hashes = [_text_hash(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+
+        with _memory_lock:
+            for text_hash in hashes:
+                vector = _memory.get((self.model_name, text_hash))
+                if vector is not None:
+                    _memory.move_to_end((self.model_name, text_hash))
+                    found[text_hash] = vector
+            _stats["memory_hits"] += len(found)
+
+        missing = list(dict.fromkeys(h for h in hashes if h not in found))
+        if missing:
+            from_disk = self._load(missing)
+            for text_hash, vector in from_disk.items():
+                self._remember((self.model_name, text_hash), vector)
+            found.update(from_disk)
+
+            to_compute = {h: text for h, text in zip(hashes, texts) if h not in found}
+            if to_compute:
+                computed = {
+                    text_hash: np.asarray(vector, dtype=np.float32)
+                    for text_hash, vector in zip(to_compute, self._compute(list(to_compute.values())))
+                }
+                self._save(computed)
+                for text_hash, vector in computed.items():
+                    self._remember((self.model_name, text_hash), vector)
+                found.update(computed)
+
+            with _memory_lock:
+                _stats["disk_hits"] += len(from_disk)
+                _stats["computed"] += len(missing) - len(from_disk)
+
+        return [found[text_hash].tolist() for text_hash in hashes]
+
+    def embed_one(self, text: str) -> List[float]:
+        """Return the embedding of a single text."""
+        return self.embed([text])[0]
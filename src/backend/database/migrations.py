@@ -0,0 +1,125 @@
+"""
+Versioned schema migrations for the SQLite database.
+
+Migrations run once at application startup; building a SQLDatabase no longer
+issues any DDL. Each migration is applied in its own write transaction and
+recorded in the schema_migrations table.
+"""
+import sqlite3
+from typing import Callable, List, Tuple
+
+from ..logger import setup_logger
+from .sql_statements import (
+    CREATE_USERS_TABLE, CREATE_EMAILS_TABLE, CREATE_TWEETS_TABLE,
+    CREATE_PROMPTS_TABLE, CREATE_CONCEPTS_TABLE, CREATE_EMAIL_CONCEPTS_TABLE,
+    CREATE_TWEETS_CONCEPTS_TABLE, CREATE_SCHEMA_MIGRATIONS_TABLE,
+    SELECT_SCHEMA_VERSION, INSERT_SCHEMA_MIGRATION, NORMALIZE_CONCEPT_DATES,
+    NORMALIZE_EMAIL_DATES, CREATE_EMAILS_USER_PROCESSED_INDEX,
+    CREATE_CONCEPTS_USER_USED_DATE_INDEX, CREATE_PROMPTS_USER_INDEX,
+    CREATE_JOBS_TABLE, CREATE_JOBS_STATUS_INDEX, CREATE_EXTRACTION_CACHE_TABLE,
+    CREATE_EXTRACTION_CACHE_LAST_USED_INDEX, CREATE_GMAIL_SYNC_STATE_TABLE,
+    DROP_GMAIL_SYNC_STATE_TABLE, CREATE_GMAIL_SYNC_STATE_BY_FILTER_TABLE
+)
+
+logger = setup_logger(__name__)
+
+
+def _create_initial_schema(cursor: sqlite3.Cursor) -> None:
+    """Create the original tables. Existing databases already have them."""
+    cursor.execute(CREATE_USERS_TABLE)
+    cursor.execute(CREATE_EMAILS_TABLE)
+    cursor.execute(CREATE_TWEETS_TABLE)
+    cursor.execute(CREATE_PROMPTS_TABLE)
+    cursor.execute(CREATE_CONCEPTS_TABLE)
+    cursor.execute(CREATE_EMAIL_CONCEPTS_TABLE)
+    cursor.execute(CREATE_TWEETS_CONCEPTS_TABLE)
+
+
+def _normalize_dates(cursor: sqlite3.Cursor) -> None:
+    """Rewrite email and concept dates as UTC 'YYYY-MM-DD HH:MM:SS' strings.
+
+    Older rows were stored with their original timezone offset, which makes
+    them sort and compare incorrectly as plain text.
+    """
+    cursor.execute(NORMALIZE_EMAIL_DATES)
+    logger.info(f"Normalized {cursor.rowcount} email dates")
+    cursor.execute(NORMALIZE_CONCEPT_DATES)
+    logger.info(f"Normalized {cursor.rowcount} concept dates")
+
+
+def _add_hot_query_indexes(cursor: sqlite3.Cursor) -> None:
+    """Index the per-user lookups used by ingestion and the concepts page."""
+    cursor.execute(CREATE_EMAILS_USER_PROCESSED_INDEX)
+    cursor.execute(CREATE_CONCEPTS_USER_USED_DATE_INDEX)
+    cursor.execute(CREATE_PROMPTS_USER_INDEX)
+
+
+def _create_jobs_table(cursor: sqlite3.Cursor) -> None:
+    """Track background ingestion jobs and their progress."""
+    cursor.execute(CREATE_JOBS_TABLE)
+    cursor.execute(CREATE_JOBS_STATUS_INDEX)
+
+
+def _create_extraction_cache_table(cursor: sqlite3.Cursor) -> None:
+    """Cache LLM concept extractions by content hash."""
+    cursor.execute(CREATE_EXTRACTION_CACHE_TABLE)
+    cursor.execute(CREATE_EXTRACTION_CACHE_LAST_USED_INDEX)
+
+
+def _create_gmail_sync_state_table(cursor: sqlite3.Cursor) -> None:
+    """Track the last synced Gmail historyId of each user."""
+    cursor.execute(CREATE_GMAIL_SYNC_STATE_TABLE)
+
+
+def _key_gmail_sync_state_by_filter(cursor: sqlite3.Cursor) -> None:
+    """Keep one Gmail sync point per user and message filter.
+
+    Existing sync points do not record the filter they were reached with,
+    so they are dropped and the next sync of each user is a full one.
+    """
+    cursor.execute(DROP_GMAIL_SYNC_STATE_TABLE)
+    cursor.execute(CREATE_GMAIL_SYNC_STATE_BY_FILTER_TABLE)
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "initial_schema", _create_initial_schema),
+    (2, "normalize_dates_to_utc", _normalize_dates),
+    (3, "add_hot_query_indexes", _add_hot_query_indexes),
+    (4, "create_jobs_table", _create_jobs_table),
+    (5, "create_extraction_cache_table", _create_extraction_cache_table),
+    (6, "create_gmail_sync_state_table", _create_gmail_sync_state_table),
+    (7, "key_gmail_sync_state_by_filter", _key_gmail_sync_state_by_filter),
+]
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    """Return the highest applied migration version."""
+    conn.execute(CREATE_SCHEMA_MIGRATIONS_TABLE)
+    return conn.execute(SELECT_SCHEMA_VERSION).fetchone()[0]
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Apply all pending migrations and return how many were applied."""
+    applied = 0
+    for version, name, migrate in MIGRATIONS:
+        if version <= get_schema_version(conn):
+            continue
+        # BEGIN IMMEDIATE serializes concurrent workers starting up together;
+        # re-check the version once we hold the write lock.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version <= conn.execute(SELECT_SCHEMA_VERSION).fetchone()[0]:
+                conn.rollback()
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            cursor = conn.cursor()
+            migrate(cursor)
+            cursor.execute(INSERT_SCHEMA_MIGRATION, (version, name))
+            conn.commit()
+            applied += 1
+        except Exception:
+            conn.rollback()
+            logger.error(f"Migration {version} ({name}) failed", exc_info=True)
+            raise
+    logger.info(f"Database schema at version {get_schema_version(conn)} ({applied} migration(s) applied)")
+    return applied
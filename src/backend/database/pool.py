@@ -0,0 +1,111 @@
+"""
+Process-wide SQLite connection pool.
+
+Each thread gets one long-lived connection per database file, configured for
+concurrent readers (WAL journal) so ingestion writes do not block the API.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict
+
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 268435456,
+    "cache_size": -65536,
+    "temp_store": "MEMORY",
+}
+
+
+class ConnectionPool:
+    """Hands out one long-lived connection per thread for a database file."""
+
+    def __init__(self, db_path: str, pragmas: Dict[str, object] = PRAGMAS):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections: Dict[threading.Thread, sqlite3.Connection] = {}
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Connections never leave their thread, but close_all() runs on the
+        # shutdown thread, so the same-thread check has to be disabled.
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Return the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError(f"Connection pool for {self.db_path} is closed")
+            self._close_dead_threads()
+            conn = self._open()
+            self._connections[threading.current_thread()] = conn
+        self._local.conn = conn
+        logger.info(f"Opened pooled SQLite connection to {self.db_path} ({len(self._connections)} open)")
+        return conn
+
+    def _close_dead_threads(self) -> None:
+        """Close connections owned by threads that have exited.
+
+        Worker pools retire idle threads, and their thread-local connection
+        would otherwise stay open until shutdown.
+        """
+        for thread in [thread for thread in self._connections if not thread.is_alive()]:
+            try:
+                self._connections.pop(thread).close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing pooled connection: {e}", exc_info=True)
+
+    def close_all(self) -> None:
+        """Close every connection handed out by this pool."""
+        with self._lock:
+            self._closed = True
+            connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing pooled connection: {e}", exc_info=True)
+        logger.info(f"Closed {len(connections)} pooled connection(s) to {self.db_path}")
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Return the process-wide pool for a database file."""
+    key = os.path.abspath(db_path)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(db_path)
+    return pool
+
+
+def close_all_pools() -> None:
+    """Close every pooled connection in the process. Call on shutdown."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
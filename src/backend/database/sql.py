@@ -5,36 +5,68 @@ import pandas as pd
 import uuid
 import hashlib
 from functools import wraps
-from typing import Optional, Callable, Any, List, Dict
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Optional, Callable, Any, List, Dict, Tuple, Iterable
 from email.utils import parsedate_to_datetime
 from pydantic import BaseModel, Field, ConfigDict
 from src.backend.logger import setup_logger
 from src.backend.schemas.llm import Concept
+from .pool import get_pool
+from .migrations import run_migrations
 from .sql_statements import (
-    CREATE_EMAILS_TABLE, CREATE_TWEETS_TABLE, CREATE_CONCEPTS_TABLE,
-    CREATE_EMAIL_CONCEPTS_TABLE, INSERT_EMAIL, SELECT_UNPROCESSED_EMAILS,
+    INSERT_EMAIL, INSERT_EMAIL_OR_IGNORE, SELECT_UNPROCESSED_EMAILS,
+    GET_EXISTING_EMAIL_IDS, GET_UNPROCESSED_EMAILS_BY_IDS,
     MARK_EMAIL_AS_PROCESSED, LOOK_FOR_EMAIL_BY_ID, INSERT_CONCEPT,
-    INSERT_EMAIL_CONCEPT, UPDATE_CONCEPT_REFERENCE_COUNT,
-    GET_UNUSED_CONCEPTS_FOR_TWEETS, INSERT_TWEET, LINK_TWEET_TO_CONCEPT,
-    CREATE_TWEETS_CONCEPTS_TABLE, UPDATE_CONCEPT_LINKS, MARK_CONCEPT_AS_USED,
-    CREATE_USERS_TABLE, CREATE_PROMPTS_TABLE
+    INSERT_EMAIL_CONCEPT, UPDATE_CONCEPT_REFERENCE_COUNT, ADD_CONCEPT_REFERENCES, INSERT_USER_CONCEPT,
+    INSERT_USER_EMAIL_CONCEPT, INSERT_USER_EMAIL_CONCEPT_OR_IGNORE, GET_CONCEPT_ID_BY_CHROMA_ID,
+    RENAME_CONCEPT_CHROMA_ID,
+    GET_UNUSED_CONCEPTS_FOR_TWEETS, GET_UNUSED_CONCEPTS_FOR_TWEETS_AFTER,
+    INSERT_TWEET, LINK_TWEET_TO_CONCEPT, UPDATE_CONCEPT_LINKS, MARK_CONCEPT_AS_USED,
+    INSERT_JOB, GET_JOB, UPDATE_JOB_STATUS, ADD_JOB_PROGRESS, FAIL_INTERRUPTED_JOBS,
+    GET_CACHED_EXTRACTION, TOUCH_CACHED_EXTRACTION, UPSERT_CACHED_EXTRACTION,
+    EVICT_EXPIRED_EXTRACTIONS, EVICT_EXCESS_EXTRACTIONS,
+    GET_GMAIL_HISTORY_ID, UPSERT_GMAIL_HISTORY_ID
 )
 
 logger = setup_logger(__name__)
 
+def to_utc_timestamp(value: Any) -> Any:
+    """Normalize an email date to a UTC 'YYYY-MM-DD HH:MM:SS' string.
+
+    Accepts datetimes, RFC 2822 strings (as found in email headers) and ISO
+    strings. Values that cannot be parsed are returned unchanged.
+    """
+    if isinstance(value, str):
+        try:
+            value = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return value
+    if not isinstance(value, datetime):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
 class SQLDatabase(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True, extra='allow')
     db_path: str = Field(default="database/echo_sqlite.db")
+    use_pool: bool = Field(default=True)
     
     def model_post_init(self, __context: Any) -> None:
         if not os.path.exists(self.db_path):
             os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-        self._create_tables()
         return self
 
     def connect(self) -> sqlite3.Connection:
-        """Create a database connection."""
+        """Return the pooled connection for this thread, or a fresh one if pooling is disabled."""
         try:
+            if self.use_pool:
+                self.conn = get_pool(self.db_path).get_connection()
+                return self.conn
             self.conn = sqlite3.connect(self.db_path)
             self.conn.row_factory = sqlite3.Row
             return self.conn
@@ -42,29 +74,23 @@ class SQLDatabase(BaseModel):
             logger.error(f"Error connecting to database: {e}", exc_info=True)
             raise
 
-    def _create_tables(self):
-        """Create necessary tables if they don't exist."""
+    def migrate(self) -> int:
+        """Apply pending schema migrations. Run once at application startup."""
+        conn = self.connect()
         try:
-            with self.connect() as conn:
-                cursor = conn.cursor()
-                cursor.execute(CREATE_USERS_TABLE)
-                cursor.execute(CREATE_EMAILS_TABLE)
-                cursor.execute(CREATE_TWEETS_TABLE)
-                cursor.execute(CREATE_PROMPTS_TABLE)
-                cursor.execute(CREATE_CONCEPTS_TABLE)
-                cursor.execute(CREATE_EMAIL_CONCEPTS_TABLE)
-                cursor.execute(CREATE_TWEETS_CONCEPTS_TABLE)
-                conn.commit()
-        except sqlite3.Error as e:
-            logger.error(f"Error creating tables: {e}", exc_info=True)
-            raise
+            return run_migrations(conn)
+        finally:
+            if not self.use_pool:
+                conn.close()
 
     def with_connection(func: Callable) -> Callable:
         """Decorator to manage database connections and cursors."""
         @wraps(func)
         def wrapper(self, *args, **kwargs) -> Any:
+            conn = None
             try:
-                with self.connect() as conn:
+                conn = self.connect()
+                with conn:
                     cursor = conn.cursor()
                     result = func(self, cursor, *args, **kwargs)
                     conn.commit()
@@ -72,6 +98,9 @@ class SQLDatabase(BaseModel):
             except sqlite3.Error as e:
                 logger.error(f"Database error in {func.__name__}: {e}", exc_info=True)
                 return False
+            finally:
+                if conn is not None and not self.use_pool:
+                    conn.close()
         return wrapper
 
     @with_connection
@@ -81,7 +110,7 @@ class SQLDatabase(BaseModel):
         if cursor.fetchone() is not None:
             return True
 
-        email_data['date'] = parsedate_to_datetime(email_data.get('date'))
+        email_data['date'] = to_utc_timestamp(email_data.get('date'))
 
         cursor.execute(
             "INSERT INTO emails (id, user_id, subject, sender, date, snippet, body) VALUES (?, ?, ?, ?, ?, ?, ?)",
@@ -97,6 +126,62 @@ class SQLDatabase(BaseModel):
         )
         return True
 
+    @with_connection
+    def store_emails_bulk(self, cursor: sqlite3.Cursor, emails: Iterable[dict], user_id: int, batch_size: int = 500) -> Tuple[List[str], int]:
+        """Store many emails, skipping the ones that already exist.
+
+        Emails are consumed lazily and written with one INSERT OR IGNORE
+        executemany per chunk of batch_size, each chunk in its own transaction.
+        If a chunk fails it is rolled back, so it is never half-written;
+        earlier chunks stay committed. The transaction takes the write lock
+        before looking up which emails already exist, so an email stored by a
+        concurrent job is never reported as inserted by both.
+
+        Returns:
+            Tuple of (inserted_ids: List[str], skipped: int), or False if a chunk failed
+        """
+        inserted_ids: List[str] = []
+        skipped = 0
+        emails = iter(emails)
+        while True:
+            batch = list(islice(emails, batch_size))
+            if not batch:
+                break
+            batch_ids = list(dict.fromkeys(email_data.get('id') for email_data in batch))
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    GET_EXISTING_EMAIL_IDS.format(placeholders=", ".join("?" * len(batch_ids))),
+                    batch_ids
+                )
+                existing = {row["id"] for row in cursor.fetchall()}
+                cursor.executemany(
+                    INSERT_EMAIL_OR_IGNORE,
+                    [
+                        (
+                            email_data.get('id'),
+                            user_id,
+                            email_data.get('subject'),
+                            email_data.get('sender'),
+                            to_utc_timestamp(email_data.get('date')),
+                            email_data.get('snippet'),
+                            email_data.get('body')
+                        )
+                        for email_data in batch
+                    ]
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Error storing emails in bulk after {len(inserted_ids)} inserts: {e}")
+                cursor.connection.rollback()
+                # with_connection turns the error into False for the caller
+                raise
+            cursor.connection.commit()
+            batch_inserted = [email_id for email_id in batch_ids if email_id not in existing]
+            inserted_ids.extend(batch_inserted)
+            skipped += len(batch) - len(batch_inserted)
+        logger.info(f"Stored {len(inserted_ids)} new emails for user {user_id}, skipped {skipped} already stored")
+        return inserted_ids, skipped
+
     @with_connection
     def store_concept(self, cursor: sqlite3.Cursor, concept: Concept, chroma_id: str, user_id: int) -> Optional[int]:
         """Store a concept in the database and return its ID."""
@@ -104,8 +189,8 @@ class SQLDatabase(BaseModel):
             links = ', '.join(concept.links)
             keywords = ', '.join(concept.keywords)
             cursor.execute(
-                "INSERT INTO concepts (user_id, title, concept_text, keywords, links, chroma_id, date) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (user_id, concept.title, concept.concept_text, keywords, links, chroma_id, concept.source_email_date)
+                INSERT_USER_CONCEPT,
+                (user_id, concept.title, concept.concept_text, keywords, links, chroma_id, to_utc_timestamp(concept.source_email_date))
             )
             return cursor.lastrowid
         except Exception as e:
@@ -137,19 +222,97 @@ class SQLDatabase(BaseModel):
     @with_connection
     def link_email_to_concept(self, cursor: sqlite3.Cursor, email_id: str, concept_id: int, user_id: int, relevance: str) -> bool:
         """Create a link between an email and a concept."""
-        cursor.execute(
-            "INSERT INTO email_concepts (email_id, concept_id, user_id, relevance) VALUES (?, ?, ?, ?)",
-            (email_id, concept_id, user_id, relevance)
-        )
+        cursor.execute(INSERT_USER_EMAIL_CONCEPT, (email_id, concept_id, user_id, relevance))
         cursor.execute(UPDATE_CONCEPT_REFERENCE_COUNT, (concept_id,))
         return True
 
+    @with_connection
+    def persist_email_concepts(
+        self,
+        cursor: sqlite3.Cursor,
+        email_id: str,
+        concepts: List[Tuple[Concept, str]],
+        user_id: int,
+        references: Optional[List[int]] = None
+    ) -> int:
+        """Store an email's concepts, link them to the email and mark it processed in one transaction.
+
+        Chroma IDs are content-addressed, so a concept whose chroma_id is
+        already stored (including one Chroma matched as similar) is linked to
+        the email and counted as a reference instead of being inserted again.
+
+        Args:
+            email_id: ID of the source email
+            concepts: (concept, chroma_id) pairs for the concepts stored or matched in Chroma
+            user_id: ID of the user who owns the email
+            references: How many times the email referenced each concept, counting
+                near-duplicates merged into it; 1 each by default
+
+        Returns:
+            The number of new concepts stored, or False if the transaction was rolled back
+        """
+        references = references or [1] * len(concepts)
+        stored = 0
+        for (concept, chroma_id), reference_count in zip(concepts, references):
+            cursor.execute(
+                INSERT_USER_CONCEPT,
+                (
+                    user_id,
+                    concept.title,
+                    concept.concept_text,
+                    ', '.join(concept.keywords),
+                    ', '.join(concept.links),
+                    chroma_id,
+                    to_utc_timestamp(concept.source_email_date)
+                )
+            )
+            if cursor.rowcount:
+                concept_id = cursor.lastrowid
+                stored += 1
+            else:
+                cursor.execute(GET_CONCEPT_ID_BY_CHROMA_ID, (chroma_id, user_id))
+                row = cursor.fetchone()
+                if row is None:
+                    raise sqlite3.IntegrityError(f"Chroma ID {chroma_id} belongs to another user")
+                concept_id = row["id"]
+            cursor.execute(INSERT_USER_EMAIL_CONCEPT_OR_IGNORE, (email_id, concept_id, user_id, concept.centrality))
+            if cursor.rowcount:
+                cursor.execute(ADD_CONCEPT_REFERENCES, (reference_count, concept_id))
+        cursor.execute(MARK_EMAIL_AS_PROCESSED, (email_id,))
+        return stored
+
+    @with_connection
+    def rename_concept_chroma_ids(self, cursor: sqlite3.Cursor, user_id: int, renames: List[Tuple[str, str]]) -> int:
+        """Replace the chroma_id of the user's concepts in one transaction.
+
+        Args:
+            user_id: ID of the user who owns the concepts
+            renames: (old_chroma_id, new_chroma_id) pairs
+
+        Returns:
+            The number of concepts updated, or False if the transaction was rolled back
+        """
+        cursor.executemany(RENAME_CONCEPT_CHROMA_ID, [(new, old, user_id) for old, new in renames])
+        return cursor.rowcount
+
     @with_connection
     def get_unprocessed_emails(self, cursor: sqlite3.Cursor, user_id: int) -> list[dict]:
         """Retrieve emails that haven't been processed for concepts."""
         cursor.execute("SELECT * FROM emails WHERE processed = FALSE AND user_id = ?", (user_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+    @with_connection
+    def get_unprocessed_emails_by_ids(self, cursor: sqlite3.Cursor, user_id: int, email_ids: List[str]) -> list[dict]:
+        """Retrieve the given emails of a user that haven't been processed yet, in the order of email_ids."""
+        if not email_ids:
+            return []
+        cursor.execute(
+            GET_UNPROCESSED_EMAILS_BY_IDS.format(placeholders=", ".join("?" * len(email_ids))),
+            (user_id, *email_ids)
+        )
+        rows = {row["id"]: dict(row) for row in cursor.fetchall()}
+        return [rows[email_id] for email_id in email_ids if email_id in rows]
+
     @with_connection
     def mark_email_as_processed(self, cursor: sqlite3.Cursor, email_id: str) -> bool:
         """Mark an email as processed."""
@@ -157,13 +320,35 @@ class SQLDatabase(BaseModel):
         return True
 
     @with_connection
-    def get_unused_concepts_for_tweets(self, cursor: sqlite3.Cursor, user_id: int, days_before: int = 30) -> list[dict]:
-        """Get concepts that haven't been used for tweets in the last N days."""
+    def get_unused_concepts_for_tweets(
+        self,
+        cursor: sqlite3.Cursor,
+        user_id: int,
+        days_before: int = 30,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[str, int]] = None
+    ) -> list[dict]:
+        """Get concepts that haven't been used for tweets in the last N days, newest first.
+
+        Args:
+            user_id: ID of the user who owns the concepts
+            days_before: Only return concepts dated on or after this many days ago
+            limit: Maximum number of concepts to return, or None for all of them
+            after: (date, id) of the last concept of the previous page, for keyset pagination
+        """
         try:
-            cursor.execute(
-                GET_UNUSED_CONCEPTS_FOR_TWEETS,
-                (user_id, f'-{days_before} days')
-            )
+            # Dates are stored as UTC 'YYYY-MM-DD HH:MM:SS', so a plain string
+            # comparison against the cutoff day can use the index.
+            since = (datetime.now(timezone.utc) - timedelta(days=days_before)).strftime("%Y-%m-%d")
+            row_limit = limit if limit is not None else -1
+            if after is None:
+                cursor.execute(GET_UNUSED_CONCEPTS_FOR_TWEETS, (user_id, since, row_limit))
+            else:
+                after_date, after_id = after
+                cursor.execute(
+                    GET_UNUSED_CONCEPTS_FOR_TWEETS_AFTER,
+                    (user_id, since, after_date, after_id, row_limit)
+                )
             columns = [col[0] for col in cursor.description]
             return [dict(zip(columns, row)) for row in cursor.fetchall()]
         except Exception as e:
@@ -370,3 +555,87 @@ class SQLDatabase(BaseModel):
             logger.error(f"Error getting prompts: {e}", exc_info=True)
             return None
 
+    @with_connection
+    def create_job(self, cursor: sqlite3.Cursor, user_id: int, kind: str) -> Optional[str]:
+        """Create a queued background job and return its ID."""
+        job_id = uuid.uuid4().hex
+        cursor.execute(INSERT_JOB, (job_id, user_id, kind))
+        return job_id
+
+    @with_connection
+    def get_job(self, cursor: sqlite3.Cursor, job_id: str, user_id: int) -> Optional[Dict]:
+        """Get a job and its progress by ID and user_id."""
+        cursor.execute(GET_JOB, (job_id, user_id))
+        job = cursor.fetchone()
+        return dict(job) if job else None
+
+    @with_connection
+    def update_job_status(self, cursor: sqlite3.Cursor, job_id: str, status: str, error: Optional[str] = None) -> bool:
+        """Move a job to a new status, recording the error if it failed."""
+        cursor.execute(UPDATE_JOB_STATUS, (status, error, status, job_id))
+        return True
+
+    @with_connection
+    def add_job_progress(
+        self,
+        cursor: sqlite3.Cursor,
+        job_id: str,
+        emails_fetched: int = 0,
+        emails_processed: int = 0,
+        concepts_extracted: int = 0,
+        failures: int = 0
+    ) -> bool:
+        """Increment a job's progress counters."""
+        cursor.execute(
+            ADD_JOB_PROGRESS,
+            (emails_fetched, emails_processed, concepts_extracted, failures, job_id)
+        )
+        return True
+
+    @with_connection
+    def fail_interrupted_jobs(self, cursor: sqlite3.Cursor) -> int:
+        """Mark jobs left queued or running by a previous process as failed."""
+        cursor.execute(FAIL_INTERRUPTED_JOBS)
+        return cursor.rowcount
+
+    @with_connection
+    def get_cached_extraction(self, cursor: sqlite3.Cursor, key: str) -> Optional[str]:
+        """Get the cached ConceptList JSON for a cache key, refreshing its last use."""
+        cursor.execute(GET_CACHED_EXTRACTION, (key,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        cursor.execute(TOUCH_CACHED_EXTRACTION, (key,))
+        return row["concepts_json"]
+
+    @with_connection
+    def store_cached_extraction(self, cursor: sqlite3.Cursor, key: str, model: str, prompt_version: str, concepts_json: str) -> bool:
+        """Store the ConceptList JSON extracted for a cache key."""
+        cursor.execute(UPSERT_CACHED_EXTRACTION, (key, model, prompt_version, concepts_json))
+        return True
+
+    @with_connection
+    def evict_cached_extractions(self, cursor: sqlite3.Cursor, max_age_days: int, max_entries: int) -> int:
+        """Drop cache entries unused for max_age_days, then the least recently used beyond max_entries.
+
+        Returns:
+            Number of evicted entries
+        """
+        cursor.execute(EVICT_EXPIRED_EXTRACTIONS, (f"-{max_age_days} days",))
+        evicted = cursor.rowcount
+        cursor.execute(EVICT_EXCESS_EXTRACTIONS, (max_entries,))
+        return evicted + cursor.rowcount
+
+    @with_connection
+    def get_gmail_history_id(self, cursor: sqlite3.Cursor, user_id: int, sync_key: str) -> Optional[str]:
+        """Get the Gmail historyId the user's mailbox was last synced at with a message filter."""
+        cursor.execute(GET_GMAIL_HISTORY_ID, (user_id, sync_key))
+        row = cursor.fetchone()
+        return row["history_id"] if row else None
+
+    @with_connection
+    def save_gmail_history_id(self, cursor: sqlite3.Cursor, user_id: int, sync_key: str, history_id: str) -> bool:
+        """Record the Gmail historyId the user's mailbox is now synced at with a message filter."""
+        cursor.execute(UPSERT_GMAIL_HISTORY_ID, (user_id, sync_key, history_id))
+        return True
+
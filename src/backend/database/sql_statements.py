@@ -103,10 +103,23 @@ SELECT_UNPROCESSED_EMAILS = """
 SELECT * FROM emails WHERE processed = FALSE;
 """
 
+GET_EXISTING_EMAIL_IDS = """
+SELECT id FROM emails WHERE id IN ({placeholders});
+"""
+
+GET_UNPROCESSED_EMAILS_BY_IDS = """
+SELECT * FROM emails WHERE user_id = ? AND processed = FALSE AND id IN ({placeholders});
+"""
+
 MARK_EMAIL_AS_PROCESSED = """
 UPDATE emails SET processed = TRUE WHERE id = ?;
 """
 
+INSERT_EMAIL_OR_IGNORE = """
+INSERT OR IGNORE INTO emails (id, user_id, subject, sender, date, snippet, body)
+VALUES (?, ?, ?, ?, ?, ?, ?);
+"""
+
 LOOK_FOR_EMAIL_BY_ID = """
 SELECT id FROM emails WHERE id = ?;
 """
@@ -116,6 +129,30 @@ INSERT INTO concepts (title, concept_text, keywords, links, chroma_id)
 VALUES (?, ?, ?, ?, ?);
 """
 
+INSERT_USER_CONCEPT = """
+INSERT INTO concepts (user_id, title, concept_text, keywords, links, chroma_id, date)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(chroma_id) DO NOTHING;
+"""
+
+GET_CONCEPT_ID_BY_CHROMA_ID = """
+SELECT id FROM concepts WHERE chroma_id = ? AND user_id = ?;
+"""
+
+INSERT_USER_EMAIL_CONCEPT_OR_IGNORE = """
+INSERT OR IGNORE INTO email_concepts (email_id, concept_id, user_id, relevance)
+VALUES (?, ?, ?, ?);
+"""
+
+RENAME_CONCEPT_CHROMA_ID = """
+UPDATE concepts SET chroma_id = ? WHERE chroma_id = ? AND user_id = ?;
+"""
+
+INSERT_USER_EMAIL_CONCEPT = """
+INSERT INTO email_concepts (email_id, concept_id, user_id, relevance)
+VALUES (?, ?, ?, ?);
+"""
+
 INSERT_EMAIL_CONCEPT = """
 INSERT INTO email_concepts (email_id, concept_id, relevance)
 VALUES (?, ?, ?);
@@ -128,6 +165,13 @@ SET times_referenced = times_referenced + 1,
 WHERE id = ?;
 """
 
+ADD_CONCEPT_REFERENCES = """
+UPDATE concepts
+SET times_referenced = times_referenced + ?,
+    updated_at = CURRENT_TIMESTAMP
+WHERE id = ?;
+"""
+
 INSERT_TWEET = """
 INSERT INTO tweets (concept_id, tweet_text, source_type, published, publish_date)
 VALUES (?, ?, ?, TRUE, CURRENT_TIMESTAMP);
@@ -146,12 +190,24 @@ ORDER BY times_referenced DESC;
 """
 
 GET_UNUSED_CONCEPTS_FOR_TWEETS = """
-SELECT DISTINCT c.id, c.title, c.concept_text, c.keywords, c.links, c.chroma_id, c.date, c.times_referenced
+SELECT c.id, c.title, c.concept_text, c.keywords, c.links, c.chroma_id, c.date, c.times_referenced
+FROM concepts c
+WHERE c.user_id = ?
+AND c.used = FALSE
+AND c.date >= ?
+ORDER BY c.date DESC, c.id DESC
+LIMIT ?;
+"""
+
+GET_UNUSED_CONCEPTS_FOR_TWEETS_AFTER = """
+SELECT c.id, c.title, c.concept_text, c.keywords, c.links, c.chroma_id, c.date, c.times_referenced
 FROM concepts c
-WHERE c.used = FALSE 
-AND c.user_id = ?
-AND date(c.date) >= date('now', ?)
-ORDER BY c.date DESC;
+WHERE c.user_id = ?
+AND c.used = FALSE
+AND c.date >= ?
+AND (c.date, c.id) < (?, ?)
+ORDER BY c.date DESC, c.id DESC
+LIMIT ?;
 """
 
 UPDATE_CONCEPT_LINKS = """
@@ -160,4 +216,183 @@ UPDATE concepts SET links = ? WHERE id = ?;
 
 MARK_CONCEPT_AS_USED = """
 UPDATE concepts SET used = TRUE WHERE id = ?;
-"""
\ No newline at end of file
+"""
+
+CREATE_SCHEMA_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+SELECT_SCHEMA_VERSION = """
+SELECT COALESCE(MAX(version), 0) FROM schema_migrations;
+"""
+
+INSERT_SCHEMA_MIGRATION = """
+INSERT INTO schema_migrations (version, name) VALUES (?, ?);
+"""
+
+NORMALIZE_CONCEPT_DATES = """
+UPDATE concepts SET date = datetime(date)
+WHERE date IS NOT NULL AND datetime(date) IS NOT NULL AND date != datetime(date);
+"""
+
+NORMALIZE_EMAIL_DATES = """
+UPDATE emails SET date = datetime(date)
+WHERE date IS NOT NULL AND datetime(date) IS NOT NULL AND date != datetime(date);
+"""
+
+CREATE_EMAILS_USER_PROCESSED_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_emails_user_processed ON emails (user_id, processed);
+"""
+
+CREATE_CONCEPTS_USER_USED_DATE_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_concepts_user_used_date ON concepts (user_id, used, date);
+"""
+
+CREATE_PROMPTS_USER_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_prompts_user ON prompts (user_id);
+"""
+
+CREATE_JOBS_TABLE = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT CHECK(status IN ('queued', 'running', 'completed', 'failed')) NOT NULL DEFAULT 'queued',
+    emails_fetched INTEGER DEFAULT 0,
+    emails_processed INTEGER DEFAULT 0,
+    concepts_extracted INTEGER DEFAULT 0,
+    failures INTEGER DEFAULT 0,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+CREATE_JOBS_STATUS_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status);
+"""
+
+INSERT_JOB = """
+INSERT INTO jobs (id, user_id, kind) VALUES (?, ?, ?);
+"""
+
+GET_JOB = """
+SELECT id, user_id, kind, status, emails_fetched, emails_processed, concepts_extracted,
+       failures, error, created_at, updated_at, finished_at
+FROM jobs WHERE id = ? AND user_id = ?;
+"""
+
+UPDATE_JOB_STATUS = """
+UPDATE jobs
+SET status = ?,
+    error = ?,
+    updated_at = CURRENT_TIMESTAMP,
+    finished_at = CASE WHEN ? IN ('completed', 'failed') THEN CURRENT_TIMESTAMP ELSE finished_at END
+WHERE id = ?;
+"""
+
+ADD_JOB_PROGRESS = """
+UPDATE jobs
+SET emails_fetched = emails_fetched + ?,
+    emails_processed = emails_processed + ?,
+    concepts_extracted = concepts_extracted + ?,
+    failures = failures + ?,
+    updated_at = CURRENT_TIMESTAMP
+WHERE id = ?;
+"""
+
+FAIL_INTERRUPTED_JOBS = """
+UPDATE jobs
+SET status = 'failed',
+    error = 'Interrupted by a server restart',
+    updated_at = CURRENT_TIMESTAMP,
+    finished_at = CURRENT_TIMESTAMP
+WHERE status IN ('queued', 'running');
+"""
+
+CREATE_EXTRACTION_CACHE_TABLE = """
+CREATE TABLE IF NOT EXISTS extraction_cache (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    concepts_json TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+CREATE_EXTRACTION_CACHE_LAST_USED_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache (last_used_at);
+"""
+
+GET_CACHED_EXTRACTION = """
+SELECT concepts_json FROM extraction_cache WHERE key = ?;
+"""
+
+TOUCH_CACHED_EXTRACTION = """
+UPDATE extraction_cache SET last_used_at = CURRENT_TIMESTAMP WHERE key = ?;
+"""
+
+UPSERT_CACHED_EXTRACTION = """
+INSERT INTO extraction_cache (key, model, prompt_version, concepts_json)
+VALUES (?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    concepts_json = excluded.concepts_json,
+    last_used_at = CURRENT_TIMESTAMP;
+"""
+
+EVICT_EXPIRED_EXTRACTIONS = """
+DELETE FROM extraction_cache WHERE last_used_at < datetime('now', ?);
+"""
+
+EVICT_EXCESS_EXTRACTIONS = """
+DELETE FROM extraction_cache
+WHERE key IN (
+    SELECT key FROM extraction_cache
+    ORDER BY last_used_at DESC
+    LIMIT -1 OFFSET ?
+);
+"""
+
+CREATE_GMAIL_SYNC_STATE_TABLE = """
+CREATE TABLE IF NOT EXISTS gmail_sync_state (
+    user_id INTEGER PRIMARY KEY,
+    history_id TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+DROP_GMAIL_SYNC_STATE_TABLE = """
+DROP TABLE IF EXISTS gmail_sync_state;
+"""
+
+# One sync point per user and message filter (senders and unread-only), since
+# a point reached with one filter says nothing about messages another keeps
+CREATE_GMAIL_SYNC_STATE_BY_FILTER_TABLE = """
+CREATE TABLE IF NOT EXISTS gmail_sync_state (
+    user_id INTEGER NOT NULL,
+    sync_key TEXT NOT NULL,
+    history_id TEXT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, sync_key),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+"""
+
+GET_GMAIL_HISTORY_ID = """
+SELECT history_id FROM gmail_sync_state WHERE user_id = ? AND sync_key = ?;
+"""
+
+UPSERT_GMAIL_HISTORY_ID = """
+INSERT INTO gmail_sync_state (user_id, sync_key, history_id) VALUES (?, ?, ?)
+ON CONFLICT(user_id, sync_key) DO UPDATE SET
+    history_id = excluded.history_id,
+    updated_at = CURRENT_TIMESTAMP;
+"""
@@ -1,33 +1,42 @@
 import os
-import chromadb
-from typing import Optional, Any, Dict
+import hashlib
+import numpy as np
+from typing import Optional, Any, List
 from datetime import datetime
 from chromadb import Collection
 from pydantic import BaseModel, Field, ConfigDict
-from chromadb import PersistentClient
-from chromadb.utils.embedding_functions.openai_embedding_function import OpenAIEmbeddingFunction
 
+from .chroma_registry import get_client, get_collection, get_embedding_function
+from .embeddings import EmbeddingCache
 from ..schemas.llm import Concept
 from ..logger import setup_logger
 
 logger = setup_logger(__name__)
 
+def make_concept_id(collection_name: str, embedding_model_name: str, concept_text: str) -> str:
+    """Content-addressed Chroma ID of a concept, stable across processes and retries."""
+    normalized = " ".join(concept_text.split()).lower()
+    digest = hashlib.sha256(f"{collection_name}\0{embedding_model_name}\0{normalized}".encode("utf-8")).hexdigest()
+    return f"concept_{digest[:32]}"
+
 class ChromaDatabase(BaseModel):
     model_config = ConfigDict(arbitrary_types_allowed=True, extra='allow')
     embedding_model_name: str = Field(default=...)
     persist_directory: str = Field(default="./database")
     collection_name: str = Field(default='concepts')
-    _collections: Dict[str, Collection] = {}
 
     def model_post_init(self, __context: Any) -> None:
         if not os.path.exists(self.persist_directory):
             os.makedirs(os.path.dirname(self.persist_directory), exist_ok=True)
         
-        self.embedding_model = OpenAIEmbeddingFunction(
-            api_key=os.getenv("OPENAI_API_KEY"), 
-            model_name=self.embedding_model_name
+        # Clients, embedding functions and collections are shared process-wide
+        self.embedding_model = get_embedding_function(self.embedding_model_name)
+        self.embeddings = EmbeddingCache(
+            embedding_function=self.embedding_model,
+            model_name=self.embedding_model_name,
+            persist_directory=self.persist_directory
         )
-        self.chroma_client = chromadb.PersistentClient(path=self.persist_directory)
+        self.chroma_client = get_client(self.persist_directory)
         
         # Initialize default collection for backward compatibility
         self._get_or_create_collection(self.collection_name)
@@ -36,12 +45,7 @@ class ChromaDatabase(BaseModel):
     def _get_or_create_collection(self, collection_name: str) -> Collection:
         """Get or create a collection by name."""
         try:
-            if collection_name not in self._collections:
-                self._collections[collection_name] = self.chroma_client.get_or_create_collection(
-                    name=collection_name,
-                    embedding_function=self.embedding_model
-                )
-            return self._collections[collection_name]
+            return get_collection(self.persist_directory, collection_name, self.embedding_model_name)
         except Exception as e:
             logger.error(f"Error getting/creating collection {collection_name}: {e}", exc_info=True)
             raise
@@ -50,9 +54,10 @@ class ChromaDatabase(BaseModel):
         """Get the collection for a specific user."""
         return self._get_or_create_collection(user_collection_id)
 
-    def _filter_docs_by_distance(self, docs, threshold=0.85) -> list[dict[str, str | dict[str, str]]]:
+    def _filter_docs_by_distance(self, collection: Collection, docs, threshold=0.85) -> list[dict[str, str | dict[str, str]]]:
+        """Keep the results whose similarity to the query reaches the threshold."""
         distances = docs['distances'][0]
-        valid_indices = [i for i, d in enumerate(distances) if d >= threshold]
+        valid_indices = [i for i, d in enumerate(distances) if self._similarity(collection, d) >= threshold]
         filtered_docs = [docs['documents'][0][i] for i in valid_indices]
         filtered_metadatas = [docs['metadatas'][0][i] for i in valid_indices]
         return [
@@ -66,13 +71,13 @@ class ChromaDatabase(BaseModel):
     def get_similar_concepts(self, concept: dict, similarity_threshold: float = 0.85, user_collection_id: Optional[str] = None) -> list[dict]:
         """Get similar concepts from the specified collection."""
         try:
-            collection = self.get_user_collection(user_collection_id) if user_collection_id else self._collections[self.collection_name]
+            collection = self.get_user_collection(user_collection_id) if user_collection_id else self._get_or_create_collection(self.collection_name)
             results = collection.query(
-                query_texts=[concept['concept_text']],
+                query_embeddings=[self.embeddings.embed_one(concept['concept_text'])],
                 n_results=5,
                 include=["metadatas", "distances", "documents"]
             )
-            return self._filter_docs_by_distance(results, similarity_threshold)
+            return self._filter_docs_by_distance(collection, results, similarity_threshold)
         except Exception as e:
             logger.error(f"Error finding similar concepts: {e}", exc_info=True)
             return []
@@ -90,41 +95,113 @@ class ChromaDatabase(BaseModel):
             logger.error(f"Error finding similar concepts: {e}", exc_info=True)
             return False
 
+    def _similarity(self, collection: Collection, distance: float) -> float:
+        """Cosine similarity for a distance Chroma reported in the collection's space.
+        
+        Assumes unit-length embeddings, as the OpenAI and MiniLM models
+        return, for which squared L2 distance is 2 - 2 * cosine similarity.
+        """
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "l2":
+            return 1 - distance / 2
+        return 1 - distance
+
+    @staticmethod
+    def _cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
     def store_concept(self, concept: Concept, similarity_threshold_limit: float = 0.85, user_collection_id: Optional[str] = None) -> Optional[str]:
-        """Store a concept in the specified collection if no similar concepts exist."""
+        """Store a concept in the specified collection if no similar concepts exist.
+
+        Returns the Chroma ID of the stored concept, or of the similar one it matched.
+        """
+        return self.store_concepts([concept], similarity_threshold_limit, user_collection_id)[0]
+
+    def store_concepts(self, concepts: List[Concept], similarity_threshold_limit: float = 0.85, user_collection_id: Optional[str] = None) -> List[Optional[str]]:
+        """Store the concepts that have no similar concept in the collection, in one round trip each for embedding, query and upsert.
+        
+        Concepts are checked in order against the collection and against the
+        ones accepted before them in the same batch, as storing them one by
+        one would. IDs are derived from the content, so a concept that is
+        already in the collection (e.g. a retried email) is returned as
+        stored without being written again. A concept counts as similar when
+        its cosine similarity to another reaches similarity_threshold_limit,
+        the meaning cluster_concepts gives the threshold too; it is then not
+        stored, and the ID of the most similar match is returned for it so
+        its references can be added to that concept.
+        
+        Returns:
+            The Chroma ID each concept was stored under or matched, in input
+            order; None for all of them if storing failed
+        """
+        if not concepts:
+            return []
         try:
-            # Check for similar concepts in the user's collection
-            similar_concepts = self.has_similar_concepts(
-                concept=concept, 
-                similarity_threshold=similarity_threshold_limit,
-                user_collection_id=user_collection_id
+            collection_name = user_collection_id or self.collection_name
+            collection = self._get_or_create_collection(collection_name)
+            concept_ids = [
+                make_concept_id(collection_name, self.embedding_model_name, concept.concept_text)
+                for concept in concepts
+            ]
+            existing = set(collection.get(ids=list(set(concept_ids)), include=[])['ids'])
+            vectors = self.embeddings.embed([concept.concept_text for concept in concepts])
+            results = collection.query(
+                query_embeddings=vectors,
+                n_results=5,
+                include=["distances"]
             )
-            if similar_concepts:
-                logger.info(f"Found similar concept(s) in collection {user_collection_id} - skipping storage")
-                return None
             
-            concept_id = f"concept_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{hash(concept.concept_text) % 10000}"
-            
-            # Get the appropriate collection
-            collection = self.get_user_collection(user_collection_id) if user_collection_id else self._collections[self.collection_name]
+            created_at = datetime.now()
+            ids: List[Optional[str]] = []
+            accepted = []
+            for i, concept in enumerate(concepts):
+                if concept_ids[i] in existing:
+                    ids.append(concept_ids[i])
+                    continue
+                vector = np.asarray(vectors[i])
+                # Query results are ordered by distance, so the first close enough is the most similar
+                match = next(
+                    (
+                        match_id
+                        for match_id, d in zip(results['ids'][i], results['distances'][i])
+                        if self._similarity(collection, d) >= similarity_threshold_limit
+                    ),
+                    None
+                ) or next(
+                    (
+                        ids[j] for j in accepted
+                        if concept_ids[j] == concept_ids[i]
+                        or self._cosine_similarity(vector, np.asarray(vectors[j])) >= similarity_threshold_limit
+                    ),
+                    None
+                )
+                if match:
+                    logger.info(f"Found similar concept {match} in collection {collection_name} - skipping storage")
+                    ids.append(match)
+                    continue
+                accepted.append(i)
+                ids.append(concept_ids[i])
             
-            collection.upsert(
-                ids=[concept_id],
-                documents=[concept.concept_text],
-                metadatas=[
-                    {
-                        "source_email_id": concept.source_email_id,
-                        "created_at": datetime.now().isoformat(),
-                        "keywords": ', '.join(concept.keywords),
-                        "centrality": concept.centrality,
-                        "collection_id": user_collection_id or self.collection_name
-                    }
-                ]
-            )
+            if accepted:
+                collection.upsert(
+                    ids=[ids[i] for i in accepted],
+                    documents=[concepts[i].concept_text for i in accepted],
+                    embeddings=[vectors[i] for i in accepted],
+                    metadatas=[
+                        {
+                            "source_email_id": concepts[i].source_email_id,
+                            "created_at": created_at.isoformat(),
+                            "keywords": ', '.join(concepts[i].keywords),
+                            "centrality": concepts[i].centrality,
+                            "collection_id": collection_name
+                        }
+                        for i in accepted
+                    ]
+                )
             
-            logger.info(f"Stored new concept with ID: {concept_id} in collection {user_collection_id or self.collection_name}")
-            return concept_id
+            logger.info(f"Stored {len(accepted)} of {len(concepts)} concepts in collection {collection_name}")
+            return ids
             
         except Exception as e:
-            logger.error(f"Error storing concept: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            logger.error(f"Error storing concepts: {e}", exc_info=True)
+            return [None] * len(concepts)
@@ -1,33 +1,106 @@
 """
 Module for loading emails from .mbox files uploaded by users.
+
+Large archives are parsed in parallel: the file is memory-mapped once to
+find the byte offset of every "From " separator line, and the messages
+between them are parsed and formatted in a process pool, a chunk of
+messages per task. Results are yielded in file order.
 """
-import mailbox
 import email
-import base64
+import mmap
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Optional, Iterator
+from typing import Optional, Iterator, List, Tuple
 from email.utils import parsedate_to_datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 from ..logger import setup_logger
 
 logger = setup_logger(__name__)
 
+MBOX_PARSE_WORKERS = int(os.getenv("ECHO_MBOX_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# Messages per worker task; large enough to amortize sending results between processes
+MBOX_CHUNK_SIZE = 200
+
+MBOX_SEPARATOR = b"From "
+
+
+def index_mbox(file_path: str) -> List[Tuple[int, int]]:
+    """Return the (start, end) byte range of every message in an mbox file.
+
+    Each range starts at the message's "From " separator line.
+    """
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            starts = [0] if mm[:len(MBOX_SEPARATOR)] == MBOX_SEPARATOR else []
+            position = mm.find(b"\n" + MBOX_SEPARATOR)
+            while position != -1:
+                starts.append(position + 1)
+                position = mm.find(b"\n" + MBOX_SEPARATOR, position + 1)
+            size = len(mm)
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _parse_ranges(file_path: str, ranges: List[Tuple[int, int]]) -> List[Optional[dict]]:
+    """Parse and format the messages in some byte ranges of an mbox file. Runs in a worker process."""
+    loader = EmailLoader(workers=1)
+    formatted = []
+    with open(file_path, "rb") as f:
+        for start, end in ranges:
+            f.seek(start)
+            data = f.read(end - start)
+            # and the blank line that ends each message before the next separator
+            if data.endswith(b"\n\n"):
+                data = data[:-1]
+            try:
+                # Drop the "From " separator line, as mailbox.mbox does
+                message = email.message_from_bytes(data[data.find(b"\n") + 1:])
+                formatted.append(loader.format_message(message))
+            except Exception as e:
+                logger.error(f"Error processing individual message: {e}", exc_info=True)
+                formatted.append(None)
+    return formatted
+
+
 class EmailLoader(BaseModel):
     """Handles loading and parsing of .mbox files."""
+    workers: int = Field(default=MBOX_PARSE_WORKERS)
     
+    def _parse_chunks(self, file_path: str, chunks: List[List[Tuple[int, int]]]) -> Iterator[List[Optional[dict]]]:
+        """Parse chunks of byte ranges, in worker processes when workers > 1, yielding results in order."""
+        if self.workers <= 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                yield _parse_ranges(file_path, chunk)
+            return
+
+        # Workers are spawned rather than forked: ingestion runs on a thread
+        # of a multi-threaded server, and forking it can copy held locks
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as executor:
+            # Bound the results waiting to be consumed, so memory does not grow with the archive
+            in_flight = deque()
+            for chunk in chunks:
+                if len(in_flight) >= self.workers * 2:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(_parse_ranges, file_path, chunk))
+            while in_flight:
+                yield in_flight.popleft().result()
+
     def process_mbox_file(self, file_path: str) -> Iterator[dict]:
-        """Process an .mbox file and yield formatted messages."""
+        """Process an .mbox file and yield formatted messages in file order."""
         try:
-            mbox = mailbox.mbox(file_path)
-            for message in mbox:
-                try:
-                    formatted_message = self.format_message(message)
+            ranges = index_mbox(file_path)
+            logger.info(f"Indexed {len(ranges)} messages in {file_path}, parsing with {self.workers} worker(s)")
+            chunks = [ranges[i:i + MBOX_CHUNK_SIZE] for i in range(0, len(ranges), MBOX_CHUNK_SIZE)]
+            for formatted_messages in self._parse_chunks(file_path, chunks):
+                for formatted_message in formatted_messages:
                     if formatted_message:
                         yield formatted_message
-                except Exception as e:
-                    logger.error(f"Error processing individual message: {e}", exc_info=True)
-                    continue
         except Exception as e:
             logger.error(f"Error opening mbox file: {e}", exc_info=True)
             yield {"error": f"Failed to process mbox file: {str(e)}"}
@@ -50,9 +123,13 @@ class EmailLoader(BaseModel):
             # Extract body
             body = None
             if message.is_multipart():
-                for part in message.walk():
-                    if part.get_content_type() in ['text/plain', 'text/html']:
-                        body = part.get_payload(decode=True).decode('utf-8', errors='replace')
+                # Prefer the plain text alternative, falling back to HTML
+                for content_type in ['text/plain', 'text/html']:
+                    for part in message.walk():
+                        if part.get_content_type() == content_type:
+                            body = part.get_payload(decode=True).decode('utf-8', errors='replace')
+                            break
+                    if body:
                         break
             else:
                 body = message.get_payload(decode=True).decode('utf-8', errors='replace')
@@ -2,14 +2,78 @@ from google.auth.external_account_authorized_user import Credentials
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build, Resource
+from googleapiclient.discovery import build_from_document, Resource
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+from google_auth_httplib2 import AuthorizedHttp
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Tuple
+import httplib2
 import os
+import threading
+import time
 
 from ..logger import setup_logger
 from .config import SCOPES, CLIENT_CONFIG
 
 logger = setup_logger(__name__)
 
+# How long a built service is reused before the token file is read again
+SERVICE_TTL_SECONDS = int(os.getenv("ECHO_GMAIL_SERVICE_TTL_SECONDS", "3600"))
+# Credentials expiring within this window are refreshed before being handed out
+REFRESH_MARGIN = timedelta(minutes=5)
+
+# token path -> (service, credentials, built at)
+_services: Dict[str, Tuple[Resource, Credentials, float]] = {}
+# One lock per token path, so a slow OAuth flow for one user never blocks the others
+_user_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _get_discovery_document() -> str:
+    """The Gmail discovery document bundled with googleapiclient, read once per process."""
+    return get_static_doc("gmail", "v1")
+
+
+def _needs_refresh(creds: Credentials) -> bool:
+    if not creds.valid:
+        return True
+    # google-auth stores expiry as a naive UTC datetime
+    return creds.expiry is not None and creds.expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+
+def _build_service(creds: Credentials) -> Resource:
+    """Build a Gmail service that can be shared across threads.
+
+    httplib2.Http is not thread-safe, so each thread sends its requests
+    through its own connection, authorized with the shared credentials and
+    kept open for as long as the service is cached.
+    """
+    local = threading.local()
+
+    def thread_http() -> AuthorizedHttp:
+        http = getattr(local, "http", None)
+        if http is None:
+            http = local.http = AuthorizedHttp(creds, http=httplib2.Http())
+        return http
+
+    def build_request(http, *args, **kwargs):
+        return HttpRequest(thread_http(), *args, **kwargs)
+
+    return build_from_document(
+        _get_discovery_document(),
+        http=thread_http(),
+        requestBuilder=build_request
+    )
+
+
+def clear_gmail_services() -> None:
+    """Forget every cached Gmail service, e.g. after a user's token was revoked or on shutdown."""
+    with _lock:
+        _services.clear()
+
 class AuthenticatorManager:
     def __init__(self, user_id: int = None):
         self.user_id = user_id
@@ -33,8 +97,8 @@ class AuthenticatorManager:
             logger.info(f'Loading credentials from {token_path}')
             creds = Credentials.from_authorized_user_file(token_path, SCOPES)
             
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
+        if not creds or _needs_refresh(creds):
+            if creds and creds.refresh_token:
                 logger.info('Refreshing expired credentials')
                 creds.refresh(Request())
             else:
@@ -48,7 +112,37 @@ class AuthenticatorManager:
         
         return creds
     
+    def _refresh(self, creds: Credentials) -> None:
+        """Refresh credentials and save them to the user's token file."""
+        logger.info(f'Refreshing credentials for user {self.user_id} ahead of expiry')
+        creds.refresh(Request())
+        with open(self._get_token_path(), 'w') as token:
+            token.write(creds.to_json())
+
     def get_gmail_service(self) -> Resource:
-        """Builds and returns a Gmail service."""
-        creds = self._authenticate()
-        return build(serviceName='gmail', version='v1', credentials=creds)
+        """Returns the user's Gmail service, reusing the one built by an earlier call.
+        
+        Services are cached per user for SERVICE_TTL_SECONDS and are safe to
+        use from several threads. Their credentials are refreshed once they
+        get within REFRESH_MARGIN of expiring.
+        """
+        key = self._get_token_path()
+        with _lock:
+            user_lock = _user_locks.setdefault(key, threading.Lock())
+        with user_lock:
+            cached = _services.get(key)
+            if cached and time.monotonic() - cached[2] < SERVICE_TTL_SECONDS:
+                service, creds, _ = cached
+                if _needs_refresh(creds) and creds.refresh_token:
+                    try:
+                        self._refresh(creds)
+                    except Exception as e:
+                        logger.error(f'Failed to refresh credentials for user {self.user_id}: {e}', exc_info=True)
+                        _services.pop(key, None)
+                        raise
+                return service
+
+            creds = self._authenticate()
+            service = _build_service(creds)
+            _services[key] = (service, creds, time.monotonic())
+            return service
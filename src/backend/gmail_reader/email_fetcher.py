@@ -3,15 +3,78 @@ API reference:
 https://developers.google.com/gmail/api/reference/rest/v1/users
 """
 import base64
-from typing import Optional
+import os
+import time
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
 from pydantic import BaseModel, model_validator, Field
 
 from .auth import AuthenticatorManager
 from ..logger import setup_logger
+from ..ratelimit import GMAIL_COSTS, MAX_RETRIES, backoff_delay, call_with_retry, get_bucket, is_retryable
 
 logger = setup_logger(__name__)
 
+# Gmail accepts at most 100 calls per batch request
+MAX_BATCH_SIZE = 100
+# and returns at most 500 messages per list page
+MAX_PAGE_SIZE = 500
+
+# 'partial' asks Gmail only for the fields format_message reads, 'full' for
+# the whole message resource
+FETCH_MODES = ('partial', 'full')
+FETCH_MODE = os.getenv('ECHO_GMAIL_FETCH_MODE', 'partial')
+# How deep the partial response follows nested multipart bodies
+MAX_MIME_DEPTH = 5
+
+
+def _part_fields(depth: int) -> str:
+    """Partial-response mask for a MIME part and its children, down to depth levels."""
+    fields = 'mimeType,filename,body(data,attachmentId)'
+    if depth > 1:
+        fields += f',parts({_part_fields(depth - 1)})'
+    return fields
+
+
+# Headers are only read from the top-level part
+MESSAGE_FIELDS = f'id,snippet,internalDate,payload(headers(name,value),{_part_fields(MAX_MIME_DEPTH)})'
+
+
+# The metadata pass that filters history listings only needs labels and the sender
+METADATA_FIELDS = 'id,labelIds,payload/headers'
+# messages.list leaves these out unless includeSpamTrash is set, so history listings do too
+EXCLUDED_LABELS = {'SPAM', 'TRASH'}
+
+
+def _from_any(sender: str, senders: List[str]) -> bool:
+    """Whether a From header matches one of senders, or senders is empty."""
+    sender = sender.lower()
+    return not senders or any(s.lower() in sender for s in senders)
+
+
+def _is_attachment(part: dict) -> bool:
+    return bool(part.get('filename') or part.get('body', {}).get('attachmentId'))
+
+
+def _find_body_part(part: dict, mime_type: str) -> Optional[dict]:
+    """Return the first part of a MIME tree with mime_type and inline data, skipping attachments."""
+    if _is_attachment(part):
+        return None
+    if part.get('mimeType') == mime_type and part.get('body', {}).get('data'):
+        return part
+    for child in part.get('parts', []):
+        found = _find_body_part(child, mime_type)
+        if found:
+            return found
+    return None
+
+
+class HistoryExpiredError(Exception):
+    """The requested startHistoryId is too old for users.history.list; a full sync is needed."""
+
+
 class EmailFetcher(BaseModel):
     model_config = {'arbitrary_types_allowed': True}
     service: Resource = Field(default=None)
@@ -24,55 +87,272 @@ class EmailFetcher(BaseModel):
             self.service = authenticator.get_gmail_service()
         return self
 
-    def list_messages(self, user_id: str = 'me', only_unread: bool = True, recipients: list[str] = []) -> list[dict[str, str]]:
-        """List all messages matching a query."""
+    def _rate_key(self) -> str:
+        """Gmail quotas are per user, so each user gets their own rate limiter bucket."""
+        return str(self.user_id or 'default')
+
+    def _execute(self, request, method: str):
+        """Execute a Gmail request through the rate limiter, retrying 429s and server errors."""
+        return call_with_retry('gmail', self._rate_key(), request.execute, cost=GMAIL_COSTS[method])
+
+    def list_messages(self, user_id: str = 'me', only_unread: bool = True, recipients: list[str] = []) -> Iterator[str]:
+        """List the IDs of all messages matching a query.
+        
+        Follows nextPageToken, 500 messages per page, and yields each ID as
+        soon as its page arrives so fetching can start before listing ends.
+        A failed page is raised, so a partial listing is never mistaken for
+        a complete one.
+        """
+        query_parts = []
+        if only_unread:
+            query_parts.append('is:unread')
+        
+        if recipients:
+            if len(recipients) == 1:
+                query_parts.append(f'from:{recipients[0]}')
+            else:
+                formatted_recipients = ' OR '.join(f'from:{email}' for email in recipients)
+                query_parts.append(f'({formatted_recipients})')
+        
+        query = ' '.join(query_parts)
+        
+        logger.info(f'Listing messages for user {user_id} with query: {query}')
+        page_token = None
+        pages = 0
+        while True:
+            try:
+                response = self._execute(self.service.users().messages().list(
+                    userId=user_id, 
+                    q=query,
+                    maxResults=MAX_PAGE_SIZE,
+                    pageToken=page_token
+                ), 'messages.list')
+            except Exception as error:
+                logger.error(f'An error occurred while listing messages after {pages} page(s): {error}')
+                raise
+            pages += 1
+            for message in response.get('messages', []):
+                yield message['id']
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                logger.info(f'Listed {pages} page(s) of messages for user {user_id}')
+                return
+    
+    def get_history_id(self, user_id: str = 'me') -> Optional[str]:
+        """Return the mailbox's current historyId, the starting point of the next incremental sync."""
         try:
-            query_parts = []
-            if only_unread:
-                query_parts.append('is:unread')
-            
-            if recipients:
-                if len(recipients) == 1:
-                    query_parts.append(f'from:{recipients[0]}')
-                else:
-                    formatted_recipients = ' OR '.join(f'from:{email}' for email in recipients)
-                    query_parts.append(f'({formatted_recipients})')
-            
-            query = ' '.join(query_parts)
-            
-            logger.info(f'Listing messages for user {user_id} with query: {query}')
-            response = self.service.users().messages().list(
-                userId=user_id, 
-                q=query,
-                maxResults=100 # max 500
-            ).execute()
-            return response.get('messages', [])
+            return str(self._execute(self.service.users().getProfile(userId=user_id), 'getProfile')['historyId'])
         except Exception as error:
-            logger.error(f'An error occurred while listing messages: {error}', exc_info=True)
-            return []
-    
+            logger.error(f'An error occurred while reading the mailbox historyId: {error}', exc_info=True)
+            return None
+
+    def list_history_messages(self, start_history_id: str, user_id: str = 'me') -> Iterator[str]:
+        """List the IDs of messages added anywhere in the mailbox since start_history_id.
+        
+        Follows nextPageToken, 500 history records per page, yielding each
+        message ID once. Messages are not restricted to the inbox, since
+        filters may label or archive newsletters; pass the IDs through
+        filter_messages to apply the sender and unread conditions of a full
+        listing. Errors are raised rather than logged, so a failed
+        sync is never mistaken for an empty one.
+        
+        Raises:
+            HistoryExpiredError: If Gmail no longer has history that far back
+        """
+        logger.info(f'Listing messages added since history {start_history_id} for user {user_id}')
+        seen = set()
+        page_token = None
+        while True:
+            try:
+                response = self._execute(self.service.users().history().list(
+                    userId=user_id,
+                    startHistoryId=start_history_id,
+                    historyTypes=['messageAdded'],
+                    maxResults=MAX_PAGE_SIZE,
+                    pageToken=page_token
+                ), 'history.list')
+            except HttpError as error:
+                if error.resp.status == 404:
+                    raise HistoryExpiredError(f'History {start_history_id} is no longer available') from error
+                raise
+            for record in response.get('history', []):
+                for added in record.get('messagesAdded', []):
+                    msg_id = added['message']['id']
+                    if msg_id not in seen:
+                        seen.add(msg_id)
+                        yield msg_id
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                logger.info(f'Found {len(seen)} messages added since history {start_history_id}')
+                return
+
     def _mark_as_read(self, user_id: str, msg_id: str) -> bool:
         """Mark a message as read by removing the UNREAD label."""
         try:
             logger.info(f"Marking message {msg_id} as read for user {user_id}")
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId=user_id,
                 id=msg_id,
                 body={
                     'removeLabelIds': ['UNREAD']
                 }
-            ).execute()
+            ), 'messages.modify')
             logger.info(f"Message {msg_id} marked as read")
             return True
         except Exception as error:
             logger.error(f"An error occurred while marking message as read: {error}", exc_info=True)
             return False
         
-    def get_raw_message(self, user_id: str, msg_id: str) -> dict:
+    def _mark_many_as_read(self, user_id: str, msg_ids: List[str]) -> bool:
+        """Remove the UNREAD label from many messages with one batchModify call."""
+        try:
+            self._execute(self.service.users().messages().batchModify(
+                userId=user_id,
+                body={
+                    'ids': msg_ids,
+                    'removeLabelIds': ['UNREAD']
+                }
+            ), 'messages.batchModify')
+            logger.info(f"{len(msg_ids)} messages marked as read")
+            return True
+        except Exception as error:
+            logger.error(f"An error occurred while marking messages as read: {error}", exc_info=True)
+            return False
+
+    def _get_request(self, user_id: str, msg_id: str, fetch_mode: str):
+        """Build the messages.get request for a fetch mode."""
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(f"Unknown fetch mode {fetch_mode!r}, expected one of {FETCH_MODES}")
+        if fetch_mode == 'partial':
+            return self.service.users().messages().get(userId=user_id, id=msg_id, fields=MESSAGE_FIELDS)
+        return self.service.users().messages().get(userId=user_id, id=msg_id)
+
+    def _execute_batch(self, msg_ids: List[str], build_request: Callable[[str], object], method: str) -> Dict[str, dict]:
+        """Send one request per message in a single Gmail batch request.
+
+        Calls that were rate limited or failed transiently are sent again,
+        up to MAX_RETRIES times, in a smaller batch.
+
+        Returns:
+            The responses of the calls that succeeded, by message ID
+        """
+        bucket = get_bucket('gmail', self._rate_key())
+        results = {}
+        pending = msg_ids
+        for attempt in range(MAX_RETRIES + 1):
+            errors = {}
+
+            def callback(request_id, response, exception):
+                if exception is not None:
+                    errors[request_id] = exception
+                else:
+                    results[request_id] = response
+
+            try:
+                bucket.acquire(GMAIL_COSTS[method] * len(pending))
+                batch = self.service.new_batch_http_request(callback=callback)
+                for msg_id in pending:
+                    batch.add(build_request(msg_id), request_id=msg_id)
+                batch.execute()
+            except Exception as error:
+                if not is_retryable(error):
+                    logger.error(f"An error occurred while executing a batch of {method}: {error}", exc_info=True)
+                    break
+                errors = {msg_id: error for msg_id in pending if msg_id not in results}
+
+            # Calls inside a batch are rate limited one by one, so only those are sent again
+            pending = [msg_id for msg_id, error in errors.items() if is_retryable(error)]
+            if not errors:
+                bucket.on_success()
+            if not pending or attempt == MAX_RETRIES:
+                for msg_id, error in errors.items():
+                    logger.error(f"An error occurred in {method} for message {msg_id}: {error}")
+                break
+            delay = backoff_delay(attempt, errors[pending[0]], bucket)
+            logger.warning(f"{len(pending)} message(s) rate limited or failed, retrying in {delay:.1f}s")
+            time.sleep(delay)
+        return results
+
+    def filter_messages(
+        self,
+        msg_ids: Iterable[str],
+        senders: List[str] = [],
+        only_unread: bool = True,
+        user_id: str = 'me',
+        batch_size: int = MAX_BATCH_SIZE,
+        failed: Optional[List[str]] = None
+    ) -> Iterator[str]:
+        """Yield the messages a full listing with the same senders and only_unread would return.
+
+        Only the labels and From header of each message are fetched, so
+        messages that are filtered out are never downloaded or marked as
+        read. Messages whose metadata could not be fetched are appended to
+        failed, if given.
+        """
+        batch_size = min(batch_size, MAX_BATCH_SIZE)
+        msg_ids = iter(msg_ids)
+        while chunk := list(islice(msg_ids, batch_size)):
+            results = self._execute_batch(
+                chunk,
+                lambda msg_id: self.service.users().messages().get(
+                    userId=user_id, id=msg_id, format='metadata', metadataHeaders=['From'], fields=METADATA_FIELDS
+                ),
+                'messages.get'
+            )
+            kept = 0
+            for msg_id in chunk:
+                message = results.get(msg_id)
+                if message is None:
+                    if failed is not None:
+                        failed.append(msg_id)
+                    continue
+                labels = set(message.get('labelIds', []))
+                headers = message.get('payload', {}).get('headers', [])
+                sender = next((header['value'] for header in headers if header['name'] == 'From'), '')
+                if labels & EXCLUDED_LABELS or (only_unread and 'UNREAD' not in labels):
+                    continue
+                if _from_any(sender, senders):
+                    kept += 1
+                    yield msg_id
+            logger.info(f"Kept {kept} of {len(chunk)} new messages after filtering on labels and senders")
+
+    def get_raw_messages(
+        self,
+        user_id: str,
+        msg_ids: Iterable[str],
+        batch_size: int = MAX_BATCH_SIZE,
+        fetch_mode: str = FETCH_MODE
+    ) -> Iterator[Optional[dict]]:
+        """Retrieve many messages, batch_size per HTTP round trip, and mark them as read.
+        
+        Each batch is fetched with a single Gmail batch request and the
+        messages it returned are marked as read with a single batchModify.
+        msg_ids is consumed lazily, so it can be the list_messages generator.
+        In 'partial' mode only the fields format_message reads are requested.
+        
+        Yields:
+            The raw message, or None if it could not be fetched, in the order of msg_ids
+        """
+        batch_size = min(batch_size, MAX_BATCH_SIZE)
+        msg_ids = iter(msg_ids)
+        while chunk := list(islice(msg_ids, batch_size)):
+            logger.info(f"Fetching {len(chunk)} raw messages in one batch")
+            results = self._execute_batch(
+                chunk,
+                lambda msg_id: self._get_request(user_id, msg_id, fetch_mode),
+                'messages.get'
+            )
+            fetched = [msg_id for msg_id in chunk if results.get(msg_id)]
+            if fetched:
+                self._mark_many_as_read(user_id, fetched)
+            for msg_id in chunk:
+                yield results.get(msg_id)
+
+    def get_raw_message(self, user_id: str, msg_id: str, fetch_mode: str = FETCH_MODE) -> dict:
         """Retrieve the raw message details by its ID."""
         try:
             logger.info(f"Fetching raw message with ID: {msg_id}")
-            message = self.service.users().messages().get(userId=user_id, id=msg_id).execute()
+            message = self._execute(self._get_request(user_id, msg_id, fetch_mode), 'messages.get')
             self._mark_as_read(user_id, msg_id)
             return message
         except Exception as error:
@@ -87,7 +367,6 @@ class EmailFetcher(BaseModel):
 
             payload = raw_message.get('payload', {})
             headers = payload.get('headers', [])
-            parts = payload.get('parts', [])
             snippet = raw_message.get('snippet', '')
             internal_date = raw_message.get('internalDate', '')
 
@@ -95,13 +374,14 @@ class EmailFetcher(BaseModel):
             sender = next((header['value'] for header in headers if header['name'] == 'From'), '(No sender)')
             date = next((header['value'] for header in headers if header['name'] == 'Date'), '(No date)')
 
+            # Prefer the plain text alternative anywhere in the MIME tree,
+            # falling back to HTML; only the chosen part is decoded
             body = None
-            for part in parts:
-                if part.get('mimeType') in ['text/plain', 'text/html']:
-                    body_data = part.get('body', {}).get('data')
-                    if body_data:
-                        body = base64.urlsafe_b64decode(body_data).decode('utf-8', errors='replace')
-                        break
+            for mime_type in ['text/plain', 'text/html']:
+                part = _find_body_part(payload, mime_type)
+                if part:
+                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='replace')
+                    break
 
             return {
                 "id": raw_message['id'],
@@ -0,0 +1 @@
+"""Background jobs for Echo application."""
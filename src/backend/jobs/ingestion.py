@@ -0,0 +1,233 @@
+"""
+Email ingestion jobs: fetch or load emails, store them and extract concepts.
+
+Both pipelines run on the job runner's worker threads and report progress to
+their row in the jobs table.
+"""
+import os
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from ..database.sql import SQLDatabase
+from ..database.vector import ChromaDatabase
+from ..gmail_reader.email_fetcher import EmailFetcher, HistoryExpiredError
+from ..gmail_loader.email_loader import EmailLoader
+from ..concepts.extractor import ConceptExtractor
+from ..schemas.api import EmailFetchRequest, MboxUploadRequest
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PROGRESS_EVERY = 50
+# One Gmail batch request
+STORE_BATCH_SIZE = 100
+
+
+def track_messages(
+    messages: Iterable[dict],
+    db: SQLDatabase,
+    job_id: str,
+    failed: Optional[List[dict]] = None
+) -> Iterator[dict]:
+    """Yield the messages that parsed, counting fetched messages and failures on the job.
+
+    Messages that did not parse are appended to failed, if given.
+    """
+    fetched = failures = 0
+    for message in messages:
+        if "error" in message:
+            logger.error(f"Error in message: {message['error']}")
+            failures += 1
+            if failed is not None:
+                failed.append(message)
+        else:
+            fetched += 1
+            yield message
+        if fetched + failures >= PROGRESS_EVERY:
+            db.add_job_progress(job_id, emails_fetched=fetched, failures=failures)
+            fetched = failures = 0
+    db.add_job_progress(job_id, emails_fetched=fetched, failures=failures)
+
+
+def store_and_stream_unprocessed(
+    messages: Iterable[dict],
+    db: SQLDatabase,
+    user_id: int,
+    batch_size: int = STORE_BATCH_SIZE
+) -> Iterator[dict]:
+    """Store messages batch by batch, yielding the emails each batch inserted.
+
+    Lets concept extraction start on the first emails while later ones are
+    still being fetched. Once every message is stored, the user's other
+    unprocessed emails (left over by earlier runs) are yielded too. Each
+    email is yielded at most once.
+    """
+    seen = set()
+    messages = iter(messages)
+    while True:
+        batch = list(islice(messages, batch_size))
+        if batch:
+            stored = db.store_emails_bulk(batch, user_id)
+            if stored is False:
+                raise RuntimeError(f"Failed to store emails for user {user_id}")
+            inserted_ids, _ = stored
+            for email in db.get_unprocessed_emails_by_ids(user_id, inserted_ids):
+                seen.add(email["id"])
+                yield email
+        if len(batch) < batch_size:
+            break
+    for email in db.get_unprocessed_emails(user_id) or []:
+        if email["id"] not in seen:
+            seen.add(email["id"])
+            yield email
+
+
+def gmail_sync_key(request: EmailFetchRequest) -> str:
+    """Identify the message filter of a request, which Gmail sync points are kept per."""
+    senders = ",".join(sorted({recipient.lower() for recipient in request.recipients}))
+    return f"only_unread={request.only_unread};from={senders}"
+
+
+def list_new_message_ids(
+    email_fetcher: EmailFetcher,
+    request: EmailFetchRequest,
+    start_history_id: Optional[str],
+    failed: Optional[List[str]] = None
+) -> Iterator[str]:
+    """List the messages to fetch: those added since start_history_id, or a full listing.
+
+    Falls back to the full listing when there is no sync point yet or Gmail
+    has expired it. History listings have no search query, so their messages
+    are filtered on senders and labels before anything else is fetched;
+    messages that could not be checked are appended to failed, if given.
+    """
+    if start_history_id:
+        try:
+            yield from email_fetcher.filter_messages(
+                email_fetcher.list_history_messages(start_history_id),
+                senders=request.recipients,
+                only_unread=request.only_unread,
+                failed=failed
+            )
+            return
+        except HistoryExpiredError as e:
+            logger.warning(f"{e}, falling back to a full listing")
+    yield from email_fetcher.list_messages(
+        only_unread=request.only_unread,
+        recipients=request.recipients
+    )
+
+
+def extract_unprocessed_concepts(
+    db: SQLDatabase,
+    concept_extractor: ConceptExtractor,
+    job_id: str,
+    similarity_threshold: float,
+    user_id: int,
+    chroma_collection_id: str,
+    emails: Optional[Iterable[dict]] = None
+) -> None:
+    """Extract concepts from the given emails, by default every unprocessed email of the user."""
+    if emails is None:
+        emails = db.get_unprocessed_emails(user_id)
+    results = concept_extractor.process_emails_concepts(
+        emails,
+        similarity_threshold,
+        user_id,
+        chroma_collection_id
+    )
+    for _, success, stored_count in results:
+        if success:
+            db.add_job_progress(job_id, emails_processed=1, concepts_extracted=stored_count)
+        else:
+            db.add_job_progress(job_id, failures=1)
+    logger.info(
+        f"Job {job_id} extracted from {concept_extractor.prompt_tokens} prompt tokens "
+        f"({concept_extractor.raw_tokens} before preprocessing)"
+    )
+    concept_extractor.cache.evict()
+
+
+def run_gmail_ingestion(job_id: str, request: EmailFetchRequest, user_id: int) -> None:
+    """Fetch emails from Gmail and extract their concepts."""
+    logger.info(f"Fetching and generating concepts with request: {request}")
+    db = SQLDatabase()
+    user = db.get_user(user_id=user_id)
+    chroma_collection_id = user["chroma_collection_id"]
+
+    vector_db = ChromaDatabase(
+        embedding_model_name=request.embedding_model_name,
+        collection_name=chroma_collection_id
+    )
+    email_fetcher = EmailFetcher(user_id=user_id)
+    concept_extractor = ConceptExtractor(
+        sql_db=db,
+        vector_db=vector_db,
+        model=request.model_name,
+    )
+
+    # Snapshot the mailbox position before listing, so messages arriving
+    # during the run are picked up by the next sync rather than skipped
+    sync_key = gmail_sync_key(request)
+    start_history_id = db.get_gmail_history_id(user_id, sync_key) if request.incremental_sync else None
+    next_history_id = email_fetcher.get_history_id()
+
+    # Listing, fetching, storing and extraction are chained generators, so
+    # the first emails are processed while later pages are still being listed
+    unchecked: List[str] = []
+    message_ids = list_new_message_ids(email_fetcher, request, start_history_id, unchecked)
+    formatted_messages = (
+        email_fetcher.format_message(raw_message)
+        for raw_message in email_fetcher.get_raw_messages('me', message_ids)
+    )
+    failed: List[dict] = []
+    messages = track_messages(formatted_messages, db, job_id, failed)
+    emails = store_and_stream_unprocessed(messages, db, user_id)
+
+    extract_unprocessed_concepts(
+        db, concept_extractor, job_id, request.similarity_threshold, user_id, chroma_collection_id, emails
+    )
+    # Listing and storing errors have already failed the job; a message that
+    # could not be fetched keeps the old sync point so the next run retries it
+    if failed or unchecked:
+        logger.warning(
+            f"{len(failed) + len(unchecked)} message(s) could not be fetched, "
+            f"keeping the sync point of user {user_id}"
+        )
+    elif next_history_id:
+        db.save_gmail_history_id(user_id, sync_key, next_history_id)
+
+
+def run_mbox_ingestion(job_id: str, mbox_path: str, request: MboxUploadRequest, user_id: int) -> None:
+    """Load emails from an uploaded .mbox file and extract their concepts.
+
+    The file is deleted when the job ends, whether it succeeds or not.
+    """
+    try:
+        db = SQLDatabase()
+        user = db.get_user(user_id=user_id)
+        chroma_collection_id = user["chroma_collection_id"]
+
+        vector_db = ChromaDatabase(
+            embedding_model_name=request.embedding_model_name,
+            collection_name=chroma_collection_id
+        )
+        concept_extractor = ConceptExtractor(
+            sql_db=db,
+            vector_db=vector_db,
+            model=request.model_name,
+        )
+
+        email_loader = EmailLoader()
+        stored = db.store_emails_bulk(
+            track_messages(email_loader.process_mbox_file(mbox_path), db, job_id),
+            user_id
+        )
+        if stored is False:
+            raise RuntimeError(f"Failed to store emails for user {user_id}")
+    finally:
+        os.unlink(mbox_path)
+
+    extract_unprocessed_concepts(
+        db, concept_extractor, job_id, request.similarity_threshold, user_id, chroma_collection_id
+    )
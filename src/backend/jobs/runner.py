@@ -0,0 +1,116 @@
+"""
+Background job runner.
+
+Long-running work (email ingestion) is submitted as a job: a row in the jobs
+table is created right away and the work runs on a bounded pool of worker
+threads that record their progress on the row as they go.
+"""
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from ..database.sql import SQLDatabase
+from ..logger import setup_logger
+
+logger = setup_logger(__name__)
+
+JOB_WORKERS = int(os.getenv("ECHO_JOB_WORKERS", "2"))
+
+
+class JobRunner:
+    """Runs jobs on a bounded thread pool and keeps their status up to date."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="echo-job")
+        # Jobs that have not started yet, with the cleanup to run if they never do
+        self._queued: Dict[str, Tuple[Future, Optional[Callable[[], None]]]] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        user_id: int,
+        func: Callable[..., Any],
+        *args: Any,
+        on_cancel: Optional[Callable[[], None]] = None,
+        **kwargs: Any
+    ) -> str:
+        """Create a job and queue func(job_id, *args, **kwargs) to run in the background.
+
+        on_cancel is called instead if the job is dropped from the queue at
+        shutdown, e.g. to delete the files the job would have cleaned up.
+
+        Returns:
+            The job ID, to be polled with SQLDatabase.get_job
+        """
+        db = SQLDatabase()
+        job_id = db.create_job(user_id, kind)
+        if not job_id:
+            raise RuntimeError(f"Failed to create {kind} job for user {user_id}")
+        with self._lock:
+            future = self._executor.submit(self._run, db, job_id, func, *args, **kwargs)
+            self._queued[job_id] = (future, on_cancel)
+        logger.info(f"Queued {kind} job {job_id} for user {user_id}")
+        return job_id
+
+    def _run(self, db: SQLDatabase, job_id: str, func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        with self._lock:
+            self._queued.pop(job_id, None)
+        db.update_job_status(job_id, "running")
+        try:
+            func(job_id, *args, **kwargs)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}", exc_info=True)
+            db.update_job_status(job_id, "failed", error=f"{e.__class__.__name__}: {e}")
+            return
+        db.update_job_status(job_id, "completed")
+        logger.info(f"Job {job_id} completed")
+
+    def shutdown(self) -> None:
+        """Stop accepting jobs and drop the queued ones.
+
+        Dropped jobs are marked failed and their on_cancel cleanup is run.
+        Running jobs are not interrupted; jobs that never finish are marked
+        failed at the next startup.
+        """
+        with self._lock:
+            queued = list(self._queued.items())
+            self._queued.clear()
+        db = SQLDatabase()
+        cancelled = 0
+        for job_id, (future, on_cancel) in queued:
+            if not future.cancel():
+                continue
+            cancelled += 1
+            db.update_job_status(job_id, "failed", error="Cancelled by a server shutdown")
+            if on_cancel is not None:
+                try:
+                    on_cancel()
+                except Exception as e:
+                    logger.error(f"Cleanup of cancelled job {job_id} failed: {e}", exc_info=True)
+        if cancelled:
+            logger.info(f"Cancelled {cancelled} queued job(s)")
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+_runner: Optional[JobRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> JobRunner:
+    """Return the process-wide job runner."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
+
+
+def shutdown_job_runner() -> None:
+    """Shut down the process-wide job runner, if it was started."""
+    global _runner
+    with _runner_lock:
+        if _runner is not None:
+            _runner.shutdown()
+            _runner = None
@@ -1,21 +1,35 @@
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Request
 from fastapi.responses import JSONResponse
 from src.backend.database.sql import SQLDatabase
+from src.backend.database.pool import close_all_pools
+from src.backend.database.chroma_registry import warm_up as warm_up_chroma, close_all_clients
 from src.backend.database.vector import ChromaDatabase
+from src.backend.gmail_reader.auth import clear_gmail_services
 from src.backend.tweets.creator import TweetCreator
-from src.backend.gmail_reader.email_fetcher import EmailFetcher
-from src.backend.gmail_loader.email_loader import EmailLoader
-from src.backend.concepts.extractor import ConceptExtractor
+from src.backend.jobs.runner import get_job_runner, shutdown_job_runner
+from src.backend.jobs.ingestion import run_gmail_ingestion, run_mbox_ingestion
 from src.backend.logger import setup_logger
+from src.backend.concurrency import run_blocking
+from src.backend.concepts.cache import ExtractionCache, get_cache_stats
+from src.backend.database.embeddings import get_embedding_stats
+from src.backend.ratelimit import get_rate_limit_stats
 from src.backend.schemas.api import (
     TweetRequest, 
     EmailFetchRequest, 
     UserAuth, 
     UserResponse,
-    MboxUploadRequest
+    MboxUploadRequest,
+    UnusedConceptsPage,
+    JobResponse
 )
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import BinaryIO, Optional, Tuple
 import traceback
+import base64
+import binascii
 import tempfile
+import hashlib
 import os
 
 from dotenv import load_dotenv, find_dotenv
@@ -24,7 +38,29 @@ load_dotenv(find_dotenv())
 
 logger = setup_logger(__name__)
 
-app = FastAPI(title="Echo API", version="1.0.0")
+# Uploads are copied to disk this many bytes at a time, so memory use does not grow with the file
+MBOX_UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_MBOX_UPLOAD_BYTES = int(os.getenv("ECHO_MAX_MBOX_UPLOAD_BYTES", str(16 * 1024 ** 3)))
+# /metrics shows process-wide counters, so by default only local clients may read them
+METRICS_LOCAL_ONLY = os.getenv("ECHO_METRICS_LOCAL_ONLY", "true").lower() == "true"
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost"}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db = SQLDatabase()
+    await run_blocking("sqlite", db.migrate)
+    interrupted = await run_blocking("sqlite", db.fail_interrupted_jobs)
+    if interrupted:
+        logger.warning(f"Marked {interrupted} interrupted job(s) as failed")
+    await run_blocking("sqlite", ExtractionCache(sql_db=db).evict)
+    await run_blocking("vector", warm_up_chroma)
+    yield
+    shutdown_job_runner()
+    close_all_clients()
+    clear_gmail_services()
+    close_all_pools()
+
+app = FastAPI(title="Echo API", version="1.0.0", lifespan=lifespan)
 
 async def get_current_user_id(user_id: int) -> int:
     """Dependency to get the current user ID from the request."""
@@ -47,66 +83,19 @@ async def general_exception_handler(request, exc):
 
 @app.post("/fetch-and-generate-concepts")
 async def fetch_and_generate_concepts(request: EmailFetchRequest, user_id: int = Depends(get_current_user_id)):
+    """Queue a Gmail ingestion job and return its ID."""
     try:
-        logger.info(f"Fetching and generating concepts with request: {request}")
         db = SQLDatabase()
-        
-        user = db.get_user(user_id=user_id)
+        user = await run_blocking("sqlite", db.get_user, user_id=user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        chroma_collection_id = user["chroma_collection_id"]
-        
-        vector_db = ChromaDatabase(
-            embedding_model_name=request.embedding_model_name,
-            collection_name=chroma_collection_id
-        )
-        logger.info("Fetching and generating concepts")
-        email_fetcher = EmailFetcher(user_id=user_id)
-        concept_extractor = ConceptExtractor(
-            sql_db=db,
-            vector_db=vector_db,
-            model=request.model_name,
-        )
-        logger.info("Fetching emails")
 
-        messages = email_fetcher.list_messages(
-            only_unread=request.only_unread,
-            recipients=request.recipients
+        job_id = await run_blocking(
+            "sqlite", get_job_runner().submit, "gmail", user_id, run_gmail_ingestion, request, user_id
         )
-        if len(messages) > 50:
-            logger.warning("I found more than 50 emails")
-            return {"status": "success", "fetched_emails": len(messages), "too_many_emails": True}
-
-        if len(messages) == 0:
-            logger.warning("No emails found")
-            return {"status": "success", "no_emails_found": True}
-        
-        processed_emails = 0
-        for message in messages:
-            raw_message = email_fetcher.get_raw_message('me', message['id'])
-            formatted_message = email_fetcher.format_message(raw_message)
-            db.store_email(formatted_message, user_id)
-            processed_emails += 1
-
-        emails = db.get_unprocessed_emails(user_id)
-        processed_concepts = 0
-        for email in emails:
-            success, stored_count = concept_extractor.process_email_concepts(
-                email, 
-                request.similarity_threshold, 
-                user_id,
-                chroma_collection_id
-            )
-            if success:
-                processed_concepts += stored_count
-
-        return {
-            "status": "success",
-            "processed_emails": processed_emails,
-            "processed_concepts": processed_concepts
-        }
-
+        return {"status": "queued", "job_id": job_id}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in fetch_and_generate_concepts: {str(e)}", exc_info=True)
         error_detail = {
@@ -116,14 +105,75 @@ async def fetch_and_generate_concepts(request: EmailFetchRequest, user_id: int =
         }
         raise HTTPException(status_code=500, detail=error_detail)
 
-@app.get("/concepts/unused")
-async def get_unused_concepts(days_before: int = 30, user_id: int = Depends(get_current_user_id)):
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, user_id: int = Depends(get_current_user_id)):
+    """Get the status and progress of a background job."""
     try:
         db = SQLDatabase()
-        concepts = db.get_unused_concepts_for_tweets(user_id=user_id, days_before=days_before)
-        if not concepts:
-            return []
-        return concepts
+        job = await run_blocking("sqlite", db.get_job, job_id, user_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return JobResponse(**job)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in get_job: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def copy_upload(source: BinaryIO, destination: BinaryIO) -> Tuple[int, str]:
+    """Copy an upload in chunks, enforcing MAX_MBOX_UPLOAD_BYTES.
+
+    Returns:
+        Tuple of (size in bytes, SHA-256 hex digest)
+    """
+    checksum = hashlib.sha256()
+    size = 0
+    while chunk := source.read(MBOX_UPLOAD_CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_MBOX_UPLOAD_BYTES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"File is larger than the {MAX_MBOX_UPLOAD_BYTES} byte limit"
+            )
+        checksum.update(chunk)
+        destination.write(chunk)
+    return size, checksum.hexdigest()
+
+
+def encode_concepts_cursor(concept: dict) -> str:
+    """Encode the (date, id) keyset of the last concept on a page."""
+    return base64.urlsafe_b64encode(f"{concept['date']}|{concept['id']}".encode()).decode()
+
+def decode_concepts_cursor(cursor: str) -> Tuple[str, int]:
+    """Decode a cursor produced by encode_concepts_cursor."""
+    try:
+        date, concept_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return date, int(concept_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/concepts/unused", response_model=UnusedConceptsPage)
+async def get_unused_concepts(
+    days_before: int = 30,
+    limit: int = Query(default=50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    try:
+        after = decode_concepts_cursor(cursor) if cursor else None
+        db = SQLDatabase()
+        concepts = await run_blocking(
+            "sqlite",
+            db.get_unused_concepts_for_tweets,
+            user_id=user_id,
+            days_before=days_before,
+            limit=limit,
+            after=after
+        )
+        next_cursor = encode_concepts_cursor(concepts[-1]) if len(concepts) == limit else None
+        return UnusedConceptsPage(concepts=concepts, next_cursor=next_cursor)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in get_unused_concepts: {str(e)}", exc_info=True)
         error_detail = {
@@ -137,7 +187,7 @@ async def get_unused_concepts(days_before: int = 30, user_id: int = Depends(get_
 async def get_concept(concept_id: int, user_id: int = Depends(get_current_user_id)):
     try:
         db = SQLDatabase()
-        concept = db.get_concept_by_id(concept_id, user_id)
+        concept = await run_blocking("sqlite", db.get_concept_by_id, concept_id, user_id)
         if not concept:
             raise HTTPException(status_code=404, detail="Concept not found")
         return concept
@@ -157,21 +207,25 @@ async def generate_tweet(request: TweetRequest, user_id: int = Depends(get_curre
     try:
         db = SQLDatabase()
         
-        user = db.get_user(user_id=user_id)
+        user = await run_blocking("sqlite", db.get_user, user_id=user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
             
         chroma_collection_id = user["chroma_collection_id"]
         
-        concept = db.get_concept_by_id(request.concept_id, user_id)
+        concept = await run_blocking("sqlite", db.get_concept_by_id, request.concept_id, user_id)
         if not concept:
             raise HTTPException(status_code=404, detail="Concept not found")
 
-        vector_db = ChromaDatabase(
+        vector_db = await run_blocking(
+            "vector",
+            ChromaDatabase,
             embedding_model_name=request.embedding_model_name,
             collection_name=chroma_collection_id
         )
-        similar_concepts = vector_db.get_similar_concepts(
+        similar_concepts = await run_blocking(
+            "vector",
+            vector_db.get_similar_concepts,
             concept=concept,
             similarity_threshold=0.85,
             user_collection_id=chroma_collection_id
@@ -189,7 +243,9 @@ async def generate_tweet(request: TweetRequest, user_id: int = Depends(get_curre
                 model_name=request.model_name
             )
 
-        result = creator.generate_tweet(
+        result = await run_blocking(
+            "llm",
+            creator.generate_tweet,
             concept=concept,
             similar_concepts=similar_concepts,
             type=request.generation_type.lower(),
@@ -214,11 +270,11 @@ async def mark_concept_as_used(concept_id: int, user_id: int = Depends(get_curre
     try:
         db = SQLDatabase()
         # First verify the concept belongs to the user
-        concept = db.get_concept_by_id(concept_id, user_id)
+        concept = await run_blocking("sqlite", db.get_concept_by_id, concept_id, user_id)
         if not concept:
             raise HTTPException(status_code=404, detail="Concept not found")
             
-        success = db.mark_concept_as_used(concept_id)
+        success = await run_blocking("sqlite", db.mark_concept_as_used, concept_id)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to mark concept as used")
         return {"status": "success"}
@@ -233,10 +289,21 @@ async def mark_concept_as_used(concept_id: int, user_id: int = Depends(get_curre
         }
         raise HTTPException(status_code=500, detail=error_detail) 
 
+@app.get("/metrics")
+async def get_metrics(request: Request, user_id: int = Depends(get_current_user_id)):
+    """Process-wide counters for the extraction and embedding caches and the provider rate limiters."""
+    if METRICS_LOCAL_ONLY and (request.client is None or request.client.host not in LOCAL_HOSTS):
+        raise HTTPException(status_code=403, detail="Metrics are only available to local clients")
+    return {
+        "extraction_cache": get_cache_stats(),
+        "embedding_cache": get_embedding_stats(),
+        "rate_limits": get_rate_limit_stats()
+    }
+
 @app.get("/user/username")
 async def get_username(user_id: int = Depends(get_current_user_id)):
     db = SQLDatabase()
-    user = db.get_user(user_id=user_id)
+    user = await run_blocking("sqlite", db.get_user, user_id=user_id)
     return user["username"]
 
 @app.get("/user/exists")
@@ -244,7 +311,7 @@ async def check_user_exists(username: str):
     """Check if a user exists."""
     try:
         db = SQLDatabase()
-        user = db.get_user(username=username)
+        user = await run_blocking("sqlite", db.get_user, username=username)
         return {"exists": user is not None}
     except Exception as e:
         logger.error(f"Error in check_user_exists: {str(e)}", exc_info=True)
@@ -255,7 +322,7 @@ async def verify_password(auth: UserAuth):
     """Verify user's password."""
     try:
         db = SQLDatabase()
-        is_valid = db.verify_password(auth.username, auth.password)
+        is_valid = await run_blocking("sqlite", db.verify_password, auth.username, auth.password)
         return {"verified": is_valid}
     except Exception as e:
         logger.error(f"Error in verify_password: {str(e)}", exc_info=True)
@@ -267,10 +334,10 @@ async def register_user(auth: UserAuth):
     try:
         db = SQLDatabase()
         # Check if user already exists
-        if db.get_user(username=auth.username):
+        if await run_blocking("sqlite", db.get_user, username=auth.username):
             raise HTTPException(status_code=400, detail="Username already exists")
         
-        user_id = db.create_user(auth.username, auth.password)
+        user_id = await run_blocking("sqlite", db.create_user, auth.username, auth.password)
         if not user_id:
             raise HTTPException(status_code=500, detail="Failed to create user")
         
@@ -286,7 +353,7 @@ async def get_user(username: str):
     """Get user information by username."""
     try:
         db = SQLDatabase()
-        user = db.get_user(username=username)
+        user = await run_blocking("sqlite", db.get_user, username=username)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
@@ -308,7 +375,7 @@ async def update_last_login(username: str):
     """Update user's last login timestamp."""
     try:
         db = SQLDatabase()
-        success = db.update_last_login(username)
+        success = await run_blocking("sqlite", db.update_last_login, username)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to update last login")
         return {"success": True}
@@ -321,7 +388,7 @@ async def save_prompts(tweet_prompt: str, thread_prompt: str, user_id: int = Dep
     """Save prompts for a user."""
     try:
         db = SQLDatabase()
-        success = db.save_prompts(user_id, tweet_prompt, thread_prompt)
+        success = await run_blocking("sqlite", db.save_prompts, user_id, tweet_prompt, thread_prompt)
         if not success:
             raise HTTPException(status_code=500, detail="Failed to save prompts")
         return {"success": True}
@@ -334,7 +401,7 @@ async def get_prompts(user_id: int = Depends(get_current_user_id)):
     """Get prompts for a user."""
     try:
         db = SQLDatabase()
-        prompts = db.get_prompts(user_id)
+        prompts = await run_blocking("sqlite", db.get_prompts, user_id)
         if not prompts:
             raise HTTPException(status_code=404, detail="No prompts found")
         return prompts
@@ -355,64 +422,32 @@ async def process_mbox_file(
 
         logger.info(f"Processing mbox file: {file.filename}")
         db = SQLDatabase()
-        
-        # Verify user exists and get their collection ID
-        user = db.get_user(user_id=user_id)
+        user = await run_blocking("sqlite", db.get_user, user_id=user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        
-        chroma_collection_id = user["chroma_collection_id"]
-        
-        # Initialize vector DB and concept extractor
-        vector_db = ChromaDatabase(
-            embedding_model_name=request.embedding_model_name,
-            collection_name=chroma_collection_id
-        )
-        concept_extractor = ConceptExtractor(
-            sql_db=db,
-            vector_db=vector_db,
-            model=request.model_name,
-        )
 
-        # Create a temporary file to store the uploaded content
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.mbox') as temp_file:
-            content = await file.read()
-            temp_file.write(content)
-            temp_file.flush()
-            
-            # Process the mbox file
-            email_loader = EmailLoader()
-            processed_emails = 0
-            for formatted_message in email_loader.process_mbox_file(temp_file.name):
-                if "error" in formatted_message:
-                    logger.error(f"Error in message: {formatted_message['error']}")
-                    continue
-                    
-                db.store_email(formatted_message, user_id)
-                processed_emails += 1
-
-        # Clean up the temporary file
-        os.unlink(temp_file.name)
-
-        # Process concepts from unprocessed emails
-        emails = db.get_unprocessed_emails(user_id)
-        processed_concepts = 0
-        for email in emails:
-            success, stored_count = concept_extractor.process_email_concepts(
-                email, 
-                request.similarity_threshold, 
-                user_id,
-                chroma_collection_id
+        # Copy the upload to a temporary file off the event loop; the job
+        # deletes it when done, and it is deleted here if anything fails
+        # before the job is queued
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mbox')
+        try:
+            with temp_file:
+                size, sha256 = await run_blocking("disk", copy_upload, file.file, temp_file)
+            if request.expected_sha256 and request.expected_sha256.lower() != sha256:
+                raise HTTPException(status_code=400, detail=f"Checksum mismatch: received file has SHA-256 {sha256}")
+            logger.info(f"Received {file.filename}: {size} bytes, SHA-256 {sha256}")
+
+            job_id = await run_blocking(
+                "sqlite", get_job_runner().submit, "mbox", user_id, run_mbox_ingestion, temp_file.name, request, user_id,
+                on_cancel=partial(os.unlink, temp_file.name)
             )
-            if success:
-                processed_concepts += stored_count
-
-        return {
-            "status": "success",
-            "processed_emails": processed_emails,
-            "processed_concepts": processed_concepts
-        }
+        except BaseException:
+            os.unlink(temp_file.name)
+            raise
+        return {"status": "queued", "job_id": job_id, "bytes": size, "sha256": sha256}
 
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in process_mbox_file: {str(e)}", exc_info=True)
         error_detail = {
@@ -420,4 +455,4 @@ async def process_mbox_file(
             "error_message": str(e),
             "traceback": traceback.format_exc()
         }
-        raise HTTPException(status_code=500, detail=error_detail)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=error_detail)
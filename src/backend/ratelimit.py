@@ -0,0 +1,227 @@
+"""
+Client-side rate limiting and retries for calls to external providers.
+
+Every call to OpenAI, DeepSeek or Gmail first takes tokens from a bucket
+shared by all threads using the same provider and API key (or Gmail user).
+A 429 halves the bucket's rate and pauses it for the Retry-After delay, and
+each success wins back a little of the configured rate, so concurrent jobs
+settle just under the provider's quota instead of hammering it. Rate-limited
+and transient failures are retried with exponential backoff and full jitter.
+
+Gmail buckets count quota units rather than requests, since a messages.get
+costs 5 units and a batchModify 50.
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Sustained rate per bucket, in requests per second (quota units for Gmail)
+PROVIDER_RATES = {
+    "openai": float(os.getenv("OPENAI_REQUESTS_PER_SECOND", "8")),
+    "deepseek": float(os.getenv("DEEPSEEK_REQUESTS_PER_SECOND", "8")),
+    "gmail": float(os.getenv("GMAIL_QUOTA_UNITS_PER_SECOND", "250")),
+}
+
+# Gmail API quota units per method
+GMAIL_COSTS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.modify": 5,
+    "messages.batchModify": 50,
+    "history.list": 2,
+    "getProfile": 1,
+}
+
+MAX_RETRIES = int(os.getenv("ECHO_MAX_RETRIES", "5"))
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# A throttled bucket never drops below this fraction of its configured rate
+MIN_RATE_FRACTION = 0.1
+# and wins back this fraction of it per successful call
+RECOVERY_FRACTION = 0.05
+
+
+class TokenBucket:
+    """A token bucket whose rate adapts to the 429s it sees."""
+
+    def __init__(self, rate: float):
+        self.max_rate = rate
+        self.rate = rate
+        # One second of burst at the configured rate
+        self.capacity = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.stats = {"calls": 0, "rate_limited": 0, "retries": 0, "failures": 0, "waited_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def _reserve(self, cost: float) -> float:
+        """Take cost tokens, returning how long the caller must wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Costs above the capacity are allowed and leave the bucket in debt
+            self.tokens -= cost
+            wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+            self.stats["calls"] += 1
+            self.stats["waited_seconds"] += wait
+            return wait
+
+    def acquire(self, cost: float = 1) -> None:
+        """Block until cost tokens are available."""
+        wait = self._reserve(cost)
+        if wait > 0:
+            time.sleep(wait)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_FRACTION)
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        """Halve the rate and, when the provider said how long to wait, pause every caller."""
+        with self._lock:
+            self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+            self.stats["rate_limited"] += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {**self.stats, "rate": round(self.rate, 3), "max_rate": self.max_rate}
+
+
+_buckets: Dict[Tuple[str, str], TokenBucket] = {}
+_lock = threading.Lock()
+
+
+def key_id(api_key: Optional[str]) -> str:
+    """Identify an API key in bucket names and metrics without revealing it."""
+    if not api_key:
+        return "default"
+    return hashlib.sha256(api_key.encode()).hexdigest()[:8]
+
+
+def get_bucket(provider: str, key: str = "default") -> TokenBucket:
+    """Return the process-wide bucket for a provider and key."""
+    bucket_key = (provider, key)
+    bucket = _buckets.get(bucket_key)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.get(bucket_key)
+            if bucket is None:
+                bucket = _buckets[bucket_key] = TokenBucket(PROVIDER_RATES[provider])
+    return bucket
+
+
+def _status_and_headers(error: Exception) -> Tuple[Optional[int], Any]:
+    """Pull the HTTP status and response headers out of an OpenAI, Gmail or requests error."""
+    # openai.APIStatusError and requests.HTTPError
+    response = getattr(error, "response", None)
+    if response is not None and hasattr(response, "status_code"):
+        return response.status_code, response.headers
+    # googleapiclient.errors.HttpError, whose httplib2 response is a dict of headers
+    resp = getattr(error, "resp", None)
+    if resp is not None and hasattr(resp, "status"):
+        return resp.status, resp
+    return getattr(error, "status_code", None), {}
+
+
+def _retry_after(headers: Any) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    # httpx and requests headers are case-insensitive, httplib2 lowercases them
+    value = headers.get("retry-after") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an error is a rate limit, a transient server error or a dropped connection."""
+    status, _ = _status_and_headers(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "ConnectionError", "Timeout")
+
+
+def backoff_delay(attempt: int, error: Exception, bucket: TokenBucket) -> float:
+    """Record a failed attempt on the bucket and return how long to wait before the next one.
+
+    Honours Retry-After when the provider sent one, otherwise uses
+    exponential backoff with full jitter.
+    """
+    status, headers = _status_and_headers(error)
+    retry_after = _retry_after(headers)
+    if status == 429:
+        bucket.on_rate_limited(retry_after)
+    bucket.count("retries")
+    if retry_after is not None:
+        return min(retry_after, MAX_DELAY)
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+
+
+def call_with_retry(
+    provider: str,
+    key: str,
+    func: Callable[..., Any],
+    *args: Any,
+    cost: float = 1,
+    **kwargs: Any
+) -> Any:
+    """Call func through the provider's bucket, retrying rate limits and transient errors.
+
+    Args:
+        provider: One of PROVIDER_RATES
+        key: The bucket within the provider, e.g. key_id(api_key) or a Gmail user
+        func: The call to make
+        cost: Tokens the call takes from the bucket
+
+    Returns:
+        Whatever func returns
+
+    Raises:
+        The last error, once it is not retryable or MAX_RETRIES is reached
+    """
+    bucket = get_bucket(provider, key)
+    for attempt in range(MAX_RETRIES + 1):
+        bucket.acquire(cost)
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                bucket.count("failures")
+                raise
+            delay = backoff_delay(attempt, e, bucket)
+            logger.warning(f"{provider} call failed ({e}), retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+        else:
+            bucket.on_success()
+            return result
+
+
+def get_rate_limit_stats() -> Dict[str, dict]:
+    """Counters and current rate of every bucket, keyed by provider:key."""
+    with _lock:
+        buckets = list(_buckets.items())
+    return {f"{provider}:{key}": bucket.snapshot() for (provider, key), bucket in buckets}
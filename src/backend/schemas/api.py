@@ -20,6 +20,8 @@ class EmailFetchRequest(BaseUserRequest):
     """Schema for email fetching and concept generation requests."""
     only_unread: bool = True
     recipients: List[str] = []
+    # Only fetch messages added since the previous sync, when there was one
+    incremental_sync: bool = True
     similarity_threshold: float = 0.85
     model_name: str
     embedding_model_name: str
@@ -37,8 +39,29 @@ class UserResponse(BaseModel):
     created_at: str
     last_login: Optional[str]
 
+class UnusedConceptsPage(BaseModel):
+    """Schema for one page of unused concepts, newest first."""
+    concepts: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class JobResponse(BaseModel):
+    """Schema for background job status and progress."""
+    id: str
+    kind: str
+    status: str
+    emails_fetched: int
+    emails_processed: int
+    concepts_extracted: int
+    failures: int
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    finished_at: Optional[str] = None
+
 class MboxUploadRequest(BaseModel):
     """Schema for mbox file upload request."""
     embedding_model_name: str = "text-embedding-ada-002"
     model_name: str = "gpt-3.5-turbo-16k"
-    similarity_threshold: float = 0.85
\ No newline at end of file
+    similarity_threshold: float = 0.85
+    # Hex SHA-256 of the file; the upload is rejected if it does not match
+    expected_sha256: Optional[str] = None
\ No newline at end of file
@@ -8,6 +8,7 @@ from goose3 import Goose
 
 from ..logger import setup_logger
 from ..database.sql import SQLDatabase
+from ..ratelimit import call_with_retry, key_id
 
 logger = setup_logger(__name__)
 
@@ -24,9 +25,13 @@ class TweetCreator(BaseModel):
 
     def model_post_init(self, __context: Any) -> None:
         if 'deepseek' in self.model_name:
-            self.llm = ChatOpenAI(model='deepseek-chat', api_key=os.getenv("DEEPSEEK_API_KEY"), base_url="https://api.deepseek.com")
+            self.provider = 'deepseek'
+            self.api_key = os.getenv("DEEPSEEK_API_KEY")
+            self.llm = ChatOpenAI(model='deepseek-chat', api_key=self.api_key, base_url="https://api.deepseek.com", max_retries=0)
         else:
-            self.llm = ChatOpenAI(model=self.model_name, api_key=os.getenv("OPENAI_API_KEY"))
+            self.provider = 'openai'
+            self.api_key = os.getenv("OPENAI_API_KEY")
+            self.llm = ChatOpenAI(model=self.model_name, api_key=self.api_key, max_retries=0)
         return self
     
     def _extract_article_from_link(self, link: str) -> Article:
@@ -72,7 +77,10 @@ class TweetCreator(BaseModel):
             chain = prompt | self.llm.with_structured_output(Tweet)
         else:
             chain = prompt | self.llm.with_structured_output(Thread)
-        return chain.invoke(
+        return call_with_retry(
+            self.provider,
+            key_id(self.api_key),
+            chain.invoke,
             {
                 "concept_title": concept['title'],
                 "concept_text": concept['concept_text'],
@@ -25,11 +25,13 @@ class EchoAPIClient:
                                   embedding_model_name: str,
                                   only_unread: bool = True,
                                   recipients: List[str] = [],
-                                  similarity_threshold: float = 0.85) -> Dict:
+                                  similarity_threshold: float = 0.85,
+                                  incremental_sync: bool = True) -> Dict:
         data = {
             "user_id": self.user_id,
             "only_unread": only_unread,
             "recipients": recipients,
+            "incremental_sync": incremental_sync,
             "similarity_threshold": similarity_threshold,
             "model_name": model_name,
             "embedding_model_name": embedding_model_name
@@ -38,13 +40,27 @@ class EchoAPIClient:
         response.raise_for_status()
         return response.json()
 
-    def get_unused_concepts(self, days_before: int = 30) -> List[Dict]:
+    def get_job(self, job_id: str) -> Dict:
+        """Get the status and progress of a background ingestion job."""
         response = requests.get(
-            f"{self.base_url}/concepts/unused",
-            params={"days_before": days_before, "user_id": self.user_id}
+            f"{self.base_url}/jobs/{job_id}",
+            params={"user_id": self.user_id}
         )
         response.raise_for_status()
         return response.json()
+
+    def get_unused_concepts(self, days_before: int = 30, limit: int = 50, cursor: Optional[str] = None) -> Dict:
+        """Get one page of unused concepts.
+
+        Returns a dict with the page's "concepts" and the "next_cursor" to pass
+        back for the following page (None on the last page).
+        """
+        params = {"days_before": days_before, "limit": limit, "user_id": self.user_id}
+        if cursor:
+            params["cursor"] = cursor
+        response = requests.get(f"{self.base_url}/concepts/unused", params=params)
+        response.raise_for_status()
+        return response.json()
     
     def get_username(self) -> str:
         response = requests.get(
@@ -190,4 +206,5 @@ class EchoAPIClient:
             files=files,
             data=data
         )
+        response.raise_for_status()
         return response.json() 
\ No newline at end of file
@@ -30,6 +30,29 @@ def show_keywords_as_pills(keywords):
                 unsafe_allow_html=True
             )
 
+def reset_unused_concepts():
+    """Drop the loaded pages so Explore Concepts fetches them again."""
+    st.session_state.unused_concepts = None
+    st.session_state.unused_concepts_cursor = None
+
+def load_unused_concepts(api_client: EchoAPIClient, days_before: int) -> list[dict]:
+    """Return the loaded unused concepts, fetching the first page if needed."""
+    if st.session_state.get('unused_concepts') is None or st.session_state.get('unused_concepts_days') != days_before:
+        page = api_client.get_unused_concepts(days_before=days_before)
+        st.session_state.unused_concepts = page['concepts']
+        st.session_state.unused_concepts_cursor = page['next_cursor']
+        st.session_state.unused_concepts_days = days_before
+    return list(st.session_state.unused_concepts)
+
+def load_more_unused_concepts(api_client: EchoAPIClient, days_before: int) -> None:
+    """Append the next page of unused concepts to the loaded ones."""
+    page = api_client.get_unused_concepts(
+        days_before=days_before,
+        cursor=st.session_state.unused_concepts_cursor
+    )
+    st.session_state.unused_concepts.extend(page['concepts'])
+    st.session_state.unused_concepts_cursor = page['next_cursor']
+
 @st.dialog(title='Concept Details', width="large")
 def show_concept_details(concept):
     st.title(concept['title'])
@@ -73,6 +96,7 @@ def show_concept_details(concept):
             api_client.set_user_id(st.session_state.user_id)
             if api_client.mark_concept_as_used(concept_id=concept['id']):
                 st.success("Concept marked as used!")
+                reset_unused_concepts()
                 st.rerun()
 
 def filter_concepts(keyword_filter: str, unused_concepts: list[dict]) -> list[dict]:
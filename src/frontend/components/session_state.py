@@ -20,6 +20,10 @@ def init_session_state():
         st.session_state.keyword_filter = ""
     if 'days_before' not in st.session_state:
         st.session_state.days_before = 30
+    if 'unused_concepts' not in st.session_state:
+        st.session_state.unused_concepts = None
+    if 'unused_concepts_cursor' not in st.session_state:
+        st.session_state.unused_concepts_cursor = None
     if 'selected_model' not in st.session_state:
         st.session_state.selected_model = "deepseek-v3"
     if 'openai_key' not in st.session_state:
@@ -1,6 +1,8 @@
 import os
+import time
 import streamlit as st
 from src.frontend.api_client import EchoAPIClient
+from src.frontend.components.concepts import reset_unused_concepts
 
 def show_error_details(error):
     """Display detailed error information in an expander."""
@@ -13,6 +15,30 @@ def show_error_details(error):
         else:
             st.error(f"Error: {str(error)}")
 
+def wait_for_job(api_client: EchoAPIClient, job_id: str, poll_seconds: float = 2.0) -> dict:
+    """Poll an ingestion job until it finishes, showing its progress."""
+    progress = st.empty()
+    while True:
+        job = api_client.get_job(job_id)
+        progress.caption(
+            f"Fetched {job['emails_fetched']} emails, processed {job['emails_processed']}, "
+            f"extracted {job['concepts_extracted']} concepts ({job['failures']} failures)"
+        )
+        if job['status'] in ('completed', 'failed'):
+            progress.empty()
+            return job
+        time.sleep(poll_seconds)
+
+def show_job_result(job: dict):
+    """Show the outcome of a completed ingestion job."""
+    reset_unused_concepts()
+    st.success(
+        f"Successfully processed {job['emails_processed']} emails "
+        f"and generated {job['concepts_extracted']} concepts!"
+    )
+    if job['failures']:
+        st.warning(f"{job['failures']} emails could not be processed.")
+
 def show_api_keys():
     """Show API keys expander in sidebar."""
     with st.expander("🔑 API Keys"):
@@ -43,8 +69,8 @@ def show_model_choice():
         )
         st.session_state.embedding_model_name = st.selectbox(
             "Select Embedding Model",
-            ["text-embedding-ada-002"],
-            help="Choose the embedding model to use for generation"
+            ["text-embedding-ada-002", "all-MiniLM-L6-v2"],
+            help="Choose the embedding model to use for generation. all-MiniLM-L6-v2 runs locally on CPU and keeps its own concept collection"
         )
 
 def show_prompt() -> int:
@@ -80,6 +106,11 @@ def show_email_fetching():
     with st.form("email_fetching"):
         st.subheader("Email Fetching")
         unread_only = st.checkbox("Only Unread Emails", value=True)
+        incremental_sync = st.checkbox(
+            "Only New Since Last Fetch",
+            value=True,
+            help="Skip emails that arrived before the previous fetch"
+        )
         recipients = st.text_area(
             "Email Recipients (one per line)",
             help="Enter email addresses to filter by, one per line"
@@ -108,18 +139,17 @@ def show_email_fetching():
                             embedding_model_name=st.session_state.embedding_model_name,
                             only_unread=unread_only,
                             recipients=recipient_list,
-                            similarity_threshold=similarity_threshold
+                            similarity_threshold=similarity_threshold,
+                            incremental_sync=incremental_sync
                         )
+                        job = wait_for_job(api_client, result['job_id'])
 
-                        if 'too_many_emails' in result and result['too_many_emails']:
-                            st.warning("I found more than 50 emails, I cannot fetch that many in the demo version\n\nTry setting a list of recipients or tick the 'Only Unread' checkbox.")
-                        elif 'no_emails_found' in result and result['no_emails_found']:
-                            st.warning("No emails found.\n\nTry unchecking the 'Only Unread' checkbox and inserting a list of recipients.")
-                        else:
-                            st.success(
-                                f"Successfully processed {result['processed_emails']} emails "
-                                f"and generated {result['processed_concepts']} concepts!"
-                            )
+                    if job['status'] == 'failed':
+                        st.error(f"Ingestion failed: {job['error']}")
+                    elif job['emails_fetched'] == 0 and job['failures'] == 0:
+                        st.warning("No emails found.\n\nTry unchecking the 'Only Unread' checkbox and inserting a list of recipients.")
+                    else:
+                        show_job_result(job)
                 except Exception as e:
                     # raise e
                     show_error_details(e)
@@ -156,11 +186,12 @@ def show_mbox_upload():
                             embedding_model_name=st.session_state.embedding_model_name,
                             similarity_threshold=similarity_threshold
                         )
-                        
-                        st.success(
-                            f"Successfully processed {result['processed_emails']} emails "
-                            f"and generated {result['processed_concepts']} concepts!"
-                        )
+                        job = wait_for_job(api_client, result['job_id'])
+
+                    if job['status'] == 'failed':
+                        st.error(f"Ingestion failed: {job['error']}")
+                    else:
+                        show_job_result(job)
                 except Exception as e:
                     raise e 
                     show_error_details(e)